@@ -0,0 +1,115 @@
+'''
+Benchmark of WKT vs WKB geometry transfer.
+
+Compares the payload size and the decode time of the two formats.
+
+Synthetic layer (no database needed):
+    python benchmarks/bench_geometry_transfer.py --features 50000 --vertices 200
+
+Live BCGW table (fetches the same rows once as WKT and once as WKB):
+    python benchmarks/bench_geometry_transfer.py --table WHSE_FOREST_VEGETATION.VEG_COMP_LYR_R1_POLY --limit 20000
+'''
+import sys
+import timeit
+import argparse
+import numpy as np
+import shapely
+from pathlib import Path
+
+# Use main scripts dir for the project path
+current_script_path = Path(__file__).resolve().parents[1]
+sys.path.append(str(current_script_path))
+
+
+def synthetic_layer(n_features, n_vertices, seed=0):
+    """Returns an array of n_features random polygons with n_vertices each (BC Albers-like coordinates)"""
+    rng = np.random.default_rng(seed)
+    angles = np.linspace(0, 2 * np.pi, n_vertices, endpoint=False)
+    centres = rng.uniform([1000000, 400000], [1800000, 1700000], size=(n_features, 2))
+    radii = rng.uniform(50, 500, size=(n_features, n_vertices))
+
+    xs = centres[:, [0]] + radii * np.cos(angles)
+    ys = centres[:, [1]] + radii * np.sin(angles)
+    coords = np.stack([xs, ys], axis=-1)
+    coords = np.concatenate([coords, coords[:, :1]], axis=1)  # close the rings
+
+    return shapely.polygons(coords)
+
+
+def time_it(func, repeat):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def report(label, wkt_values, wkb_values, repeat):
+    """Prints bytes transferred and decode time of both formats"""
+    wkt_bytes = sum(len(v) for v in wkt_values)
+    wkb_bytes = sum(len(v) for v in wkb_values)
+
+    wkt_arr = np.asarray(wkt_values, dtype=object)
+    wkb_arr = np.asarray(wkb_values, dtype=object)
+    t_wkt = time_it(lambda: shapely.from_wkt(wkt_arr), repeat)
+    t_wkb = time_it(lambda: shapely.from_wkb(wkb_arr), repeat)
+
+    print(f'\n{label}: {len(wkt_values)} features')
+    print(f'  {"format":<8}{"bytes":>16}{"decode (s)":>14}')
+    print(f'  {"WKT":<8}{wkt_bytes:>16,}{t_wkt:>14.3f}')
+    print(f'  {"WKB":<8}{wkb_bytes:>16,}{t_wkb:>14.3f}')
+    print(f'  WKB is {wkt_bytes / max(wkb_bytes, 1):.1f}x smaller and decodes {t_wkt / max(t_wkb, 1e-9):.1f}x faster')
+
+
+def bench_synthetic(n_features, n_vertices, repeat):
+    geoms = synthetic_layer(n_features, n_vertices)
+    # Oracle's TO_WKTGEOMETRY writes full-precision coordinates
+    wkt_values = list(shapely.to_wkt(geoms, rounding_precision=-1))
+    wkb_values = list(shapely.to_wkb(geoms))
+
+    report(f'Synthetic layer ({n_vertices} vertices/feature)', wkt_values, wkb_values, repeat)
+
+
+def bench_table(table, limit, repeat):
+    from config import HOSTNAME
+    from modules.connection_pool import get_session_pool, close_session_pool
+    from modules.metadata_cache import GeomMetadataCache
+    from modules.query_fetch import read_arrow
+
+    pool = get_session_pool(HOSTNAME)
+    query = """
+            SELECT SDO_UTIL.{fn}(b.{geom_col}) SHAPE
+            FROM {tab} b
+            WHERE rownum <= :lim
+            """
+    try:
+        with pool.acquire() as connection:
+            cache = GeomMetadataCache()
+            cache.fill(connection, [table])
+            metadata = cache.get(table)
+            if metadata is None:
+                print(f'..{table} has no geometry metadata in ALL_SDO_GEOM_METADATA: skipped')
+                return
+            geom_col = metadata[0]
+
+            fetched = {}
+            for fn in ('TO_WKTGEOMETRY', 'TO_WKBGEOMETRY'):
+                q = query.format(fn=fn, geom_col=geom_col, tab=table)
+                start_t = timeit.default_timer()
+                fetched[fn] = read_arrow(connection, q, {'lim': limit}).column('SHAPE').to_pylist()
+                print(f'..{fn}: fetched in {timeit.default_timer() - start_t:.2f}s')
+    finally:
+        close_session_pool()
+
+    report(table, fetched['TO_WKTGEOMETRY'], fetched['TO_WKBGEOMETRY'], repeat)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='WKT vs WKB geometry transfer benchmark')
+    parser.add_argument('--features', type=int, default=50000)
+    parser.add_argument('--vertices', type=int, default=200)
+    parser.add_argument('--table', help='BCGW OWNER.TABLE to benchmark instead of a synthetic layer')
+    parser.add_argument('--limit', type=int, default=20000, help='Rows fetched from --table')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.table:
+        bench_table(args.table, args.limit, args.repeat)
+    else:
+        bench_synthetic(args.features, args.vertices, args.repeat)
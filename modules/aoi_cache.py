@@ -0,0 +1,201 @@
+'''
+Local cache of the Tantalis crown tenure AOIs.
+
+Resolving a tenure AOI queries WHSE_TANTALIS.TA_CROWN_TENURES_SVW on the
+(CROWN_LANDS_FILE, DISPOSITION_TRANSACTION_SID, INTRID_SID) triple. The
+geometry is cached in a GeoPackage keyed by that triple, so repeat and
+amended reports of the same tenure resolve their AOI without a database
+round trip.
+
+The GeoPackage is written with SPATIAL_INDEX=NO (AOIs are looked up by
+key, never by location), which also lets the last-used times and the
+evictions be plain sqlite3 updates. Entries older than max_age_days are
+fetched again, and the least recently used entries are evicted when the
+cached geometries exceed max_size_mb.
+'''
+import os
+import sys
+import time
+import sqlite3
+import threading
+import shapely
+import pyogrio
+import geopandas as gpd
+from pathlib import Path
+
+# Use main scripts dir for the project path
+current_script_path = Path(__file__).resolve().parents[1]
+sys.path.append(str(current_script_path))
+
+from modules.cache_utils import cache_path
+from modules.query_fetch import read_arrow
+
+
+DEFAULT_MAX_AGE_DAYS = 7
+DEFAULT_MAX_SIZE_MB = 200
+LAYER = 'aoi'
+
+
+def tenure_key(file_nbr, disp_id, parcel_id):
+    """Returns the cache key of a tenure triple (parcel_id None for all the parcels)"""
+    return '|'.join('' if x is None else str(x).strip() for x in (file_nbr, disp_id, parcel_id))
+
+
+def gpkg_to_wkb(blob):
+    """Returns the WKB of a GeoPackage geometry blob (header and envelope stripped)"""
+    flags = blob[3]
+    envelope = (0, 32, 48, 48, 64)[(flags >> 1) & 0b111]
+
+    return bytes(blob[8 + envelope:])
+
+
+def fetch_tenure_aoi(connection, query, file_nbr, disp_id, parcel_id):
+    """
+    Returns the AOI of a crown tenure from BCGW, merged into one geometry.
+
+    Args:
+        connection: Database connection.
+        query (str): The 'aoi' query of UniversalOverlapTool.load_queries(binary=True).
+        file_nbr, disp_id, parcel_id: Tenure triple (disp_id and parcel_id None for all the
+                                      dispositions / parcels of the file).
+
+    Returns:
+        gpd.GeoDataFrame: One row in EPSG:3005, or None if the tenure was not found.
+    """
+    bvars = {'file_nbr': str(file_nbr),
+             'disp_id': None if disp_id is None else int(disp_id),
+             'parcel_id': None if parcel_id is None else int(parcel_id)}
+    shapes = read_arrow(connection, query, bvars).column('SHAPE').to_pylist()
+    if not shapes:
+        return None
+
+    geoms = shapely.from_wkb(shapes) if isinstance(shapes[0], bytes) else shapely.from_wkt(shapes)
+
+    return merge_aoi(gpd.GeoDataFrame(geometry=geoms, crs='EPSG:3005'))
+
+
+def merge_aoi(gdf):
+    """Returns the AOI of a tenure as a one-row gdf: all its geometries merged into one (2D)"""
+    geom = shapely.force_2d(shapely.union_all(gdf.geometry.values))
+
+    return gpd.GeoDataFrame(geometry=[geom], crs=gdf.crs)
+
+
+
+class AoiCache:
+    def __init__(self, cache_file=None, max_age_days=DEFAULT_MAX_AGE_DAYS, max_size_mb=DEFAULT_MAX_SIZE_MB):
+        """
+        Initialize the AoiCache.
+
+        Args:
+            cache_file (str): Path of the GeoPackage.
+            max_age_days (float): Age after which a cached AOI is fetched again.
+            max_size_mb (float): Total size of the cached geometries before LRU eviction.
+        """
+        self.cache_file = cache_file or cache_path('aoi_cache.gpkg')
+        self.max_age = max_age_days * 86400
+        self.max_size = max_size_mb * 1024 * 1024
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+
+    def connect(self):
+        return sqlite3.connect(self.cache_file, timeout=30)
+
+
+    def get(self, file_nbr, disp_id, parcel_id):
+        """Returns the cached AOI of a tenure (one-row gdf), or None if not cached or expired"""
+        key = tenure_key(file_nbr, disp_id, parcel_id)
+        with self._lock:
+            if not os.path.exists(self.cache_file):
+                return None
+            connection = self.connect()
+            try:
+                row = connection.execute(f"SELECT fid, geom, srid, cached_at FROM {LAYER} WHERE tenure_key = ?",
+                                         (key,)).fetchone()
+                if row is None or time.time() - row[3] > self.max_age:
+                    return None
+                connection.execute(f"UPDATE {LAYER} SET last_used = ? WHERE fid = ?", (time.time(), row[0]))
+                connection.commit()
+            finally:
+                connection.close()
+
+        geom = shapely.from_wkb(gpkg_to_wkb(row[1]))
+
+        return gpd.GeoDataFrame(geometry=[geom], crs=f'EPSG:{row[2]}')
+
+
+    def put(self, file_nbr, disp_id, parcel_id, gdf):
+        """Caches the AOI of a tenure (merged into one geometry) and evicts old entries"""
+        gdf = merge_aoi(gdf)
+        now = time.time()
+        entry = gpd.GeoDataFrame({'tenure_key': [tenure_key(file_nbr, disp_id, parcel_id)],
+                                  'srid': [gdf.crs.to_epsg()],
+                                  'cached_at': [now],
+                                  'last_used': [now]},
+                                 geometry=gdf.geometry.values, crs=gdf.crs)
+
+        with self._lock:
+            exists = os.path.exists(self.cache_file)
+            if exists:
+                self.delete(entry['tenure_key'].iloc[0])
+            pyogrio.write_dataframe(entry, self.cache_file, layer=LAYER, driver='GPKG', append=exists,
+                                    layer_options={'SPATIAL_INDEX': 'NO'})
+            if not exists:
+                connection = self.connect()
+                with connection:
+                    connection.execute(f"CREATE INDEX {LAYER}_tenure_key ON {LAYER} (tenure_key)")
+                connection.close()
+            self.evict()
+
+
+    def delete(self, key):
+        connection = self.connect()
+        try:
+            connection.execute(f"DELETE FROM {LAYER} WHERE tenure_key = ?", (key,))
+            connection.commit()
+        finally:
+            connection.close()
+
+
+    def evict(self):
+        """Deletes the expired entries, then the least recently used ones above max_size_mb"""
+        connection = self.connect()
+        try:
+            connection.execute(f"DELETE FROM {LAYER} WHERE cached_at < ?", (time.time() - self.max_age,))
+            rows = connection.execute(f"SELECT fid, LENGTH(geom) FROM {LAYER} ORDER BY last_used DESC").fetchall()
+            total = 0
+            evicted = []
+            for i, (fid, size) in enumerate(rows):
+                total += size or 0
+                if total > self.max_size and i > 0:   # the most recent entry is always kept
+                    evicted.append((fid,))
+            connection.executemany(f"DELETE FROM {LAYER} WHERE fid = ?", evicted)
+            connection.commit()
+        finally:
+            connection.close()
+
+
+    def get_or_fetch(self, file_nbr, disp_id, parcel_id, fetch):
+        """
+        Returns the AOI of a tenure (one-row gdf), from the cache or from fetch() on a miss.
+
+        Args:
+            fetch (callable): Returns the AOI gdf from the database (e.g. fetch_tenure_aoi), or None.
+        """
+        gdf = self.get(file_nbr, disp_id, parcel_id)
+        if gdf is not None:
+            self.hits += 1
+            return gdf
+
+        self.misses += 1
+        gdf = fetch()
+        if gdf is None or not len(gdf):
+            return None
+
+        # same shape as a cache hit
+        gdf = merge_aoi(gdf)
+        self.put(file_nbr, disp_id, parcel_id, gdf)
+
+        return gdf
@@ -0,0 +1,87 @@
+'''
+Preparation of the AOI geometry for the overlay queries.
+
+The AOI parcels are merged with one vectorized union (or coverage union
+for edge-matched parcels), snapped to a fixed precision grid, and Z values
+are dropped. A simplified copy, buffered by
+the simplification tolerance so that it always contains the exact AOI,
+is kept next to it as a cheap primary filter: candidates are selected
+against the few vertices of the simplified copy and only those are tested
+against the exact AOI.
+'''
+import shapely
+from pyproj import CRS
+
+
+DEFAULT_GRID_SIZE = 0.001         # precision of the AOI coordinates (1 mm in BC Albers)
+DEFAULT_SIMPLIFY_TOLERANCE = 1.0  # max distance between the AOI and its simplified copy (m)
+PROJECTED_CRS = 'EPSG:3005'       # CRS of the AOIs given in a geographic CRS (BC Albers)
+
+
+class PreparedAoi:
+    """Merged 2D AOI, its simplified filter copy and SRID"""
+    __slots__ = ('geometry', 'simplified', 'tolerance', 'crs', 'srid')
+
+    def __init__(self, geometry, simplified, tolerance, crs):
+        self.geometry = geometry
+        self.simplified = simplified
+        self.tolerance = tolerance
+        self.crs = crs
+        self.srid = crs.to_epsg() if crs is not None else None
+
+    @property
+    def wkb(self):
+        return shapely.to_wkb(self.geometry)
+
+    def __repr__(self):
+        return (f"PreparedAoi({shapely.get_num_coordinates(self.geometry)} vertices, "
+                f"simplified {shapely.get_num_coordinates(self.simplified)}, srid {self.srid})")
+
+
+def simplified_cover(geom, tolerance):
+    """
+    Returns a simplified copy of a geometry that contains it: Douglas-Peucker keeps every
+    point of the geometry within tolerance of the simplified copy, which is then buffered
+    by tolerance. Mitred joins contain the round ones without adding vertices.
+    """
+    if tolerance <= 0 or shapely.is_empty(geom):
+        return geom
+    simplified = shapely.simplify(geom, tolerance, preserve_topology=True)
+
+    return shapely.buffer(simplified, tolerance, join_style='mitre', mitre_limit=2.0)
+
+
+def prepare_aoi(gdf, grid_size=DEFAULT_GRID_SIZE, tolerance=DEFAULT_SIMPLIFY_TOLERANCE, coverage=False):
+    """
+    Merges the AOI features into one 2D geometry snapped to a precision grid.
+
+    The grid size and tolerance are in metres: an AOI in a geographic CRS is
+    reprojected to PROJECTED_CRS first (see PreparedAoi.crs).
+
+    Args:
+        gdf (gpd.GeoDataFrame): AOI features (parcels).
+        grid_size (float): Precision grid of the merged AOI, in CRS units.
+        tolerance (float): Simplification tolerance of the filter copy, in CRS units.
+        coverage (bool): The features form a coverage (edge-matched, non-overlapping parcels):
+                         merge them with the faster coverage union.
+
+    Returns:
+        PreparedAoi
+    """
+    if gdf.crs is not None and CRS.from_user_input(gdf.crs).is_geographic:
+        gdf = gdf.to_crs(PROJECTED_CRS)
+
+    geoms = shapely.force_2d(gdf.geometry.values[~gdf.geometry.isna().to_numpy()])
+    invalid = ~shapely.is_valid(geoms)
+    if invalid.any():
+        geoms[invalid] = shapely.make_valid(geoms[invalid])
+
+    if len(geoms) == 1:
+        geom = geoms[0]
+    elif coverage:
+        geom = shapely.coverage_union_all(geoms)
+    else:
+        geom = shapely.union_all(geoms)
+    geom = shapely.set_precision(geom, grid_size)
+
+    return PreparedAoi(geom, simplified_cover(geom, tolerance), tolerance, gdf.crs)
@@ -0,0 +1,238 @@
+'''
+Staging of the AOI in a session temporary table.
+
+Instead of sending the AOI WKB as a bind variable with every overlay query
+(hundreds of KB for complex multi-parcel AOIs, times 100+ datasets), the
+AOI is inserted once per session into a global temporary table with a
+spatial index, and the overlay queries join that table.
+
+OracleAoiStage stages the AOI in BCGW. SqliteAoiStage is a local stand-in:
+the same staged SQL runs on a SQLite connection where the SDO functions
+are registered as shapely-backed SQL functions, so the staged queries can
+be tested without BCGW.
+'''
+import re
+import hashlib
+import threading
+import sqlite3
+import numpy as np
+import oracledb
+import shapely
+from pyproj import Transformer
+
+
+STAGE_TABLE = 'AST_AOI_STAGE'
+STAGE_SRID = 3005   # BC Albers: staged geometries must match the SRID of the spatial index
+
+ORACLE_DDL = [
+    f"""CREATE GLOBAL TEMPORARY TABLE {STAGE_TABLE} (
+            AOI_KEY VARCHAR2(64),
+            SRID NUMBER,
+            SHAPE SDO_GEOMETRY)
+        ON COMMIT PRESERVE ROWS""",
+
+    f"""INSERT INTO USER_SDO_GEOM_METADATA (TABLE_NAME, COLUMN_NAME, DIMINFO, SRID)
+        VALUES ('{STAGE_TABLE}', 'SHAPE',
+                SDO_DIM_ARRAY(SDO_DIM_ELEMENT('X', 200000, 1900000, 0.005),
+                              SDO_DIM_ELEMENT('Y', 300000, 1800000, 0.005)),
+                {STAGE_SRID})""",
+
+    f"""CREATE INDEX {STAGE_TABLE}_SIX ON {STAGE_TABLE} (SHAPE)
+        INDEXTYPE IS MDSYS.SPATIAL_INDEX_V2"""
+]
+
+
+def aoi_key(wkb_aoi, srid):
+    """Returns the key of an AOI in the staging table"""
+    return hashlib.sha1(bytes(wkb_aoi) + str(srid).encode()).hexdigest()[:32]
+
+
+def staged_query(template):
+    """
+    Returns the staged version of an overlay query template: the AOI built from
+    the :wkb_aoi bind variable is replaced by a join on the staging table.
+    The staged query binds :aoi_key and :srid_t instead of :wkb_aoi and :srid.
+    """
+    # the staged AOI is already in the SRID of the table (STAGE_SRID)
+    sql = template.replace('SDO_CS.TRANSFORM(SDO_GEOMETRY(:wkb_aoi, :srid), :srid_t)', 'a.SHAPE')
+    sql = sql.replace('SDO_GEOMETRY(:wkb_aoi, :srid_t)', 'a.SHAPE')
+    sql = sql.replace('SDO_GEOMETRY(:wkb_aoi, :srid)', 'a.SHAPE')
+    sql = sql.replace('SELECT {cols}', 'SELECT /*+ ORDERED */ {cols}')
+    sql = sql.replace('FROM {tab} b', f'FROM {STAGE_TABLE} a, {{tab}} b')
+    sql = sql.replace('WHERE SDO_WITHIN_DISTANCE',
+                      'WHERE a.AOI_KEY = :aoi_key\n                            AND a.SRID = :srid_t\n'
+                      '                            AND SDO_WITHIN_DISTANCE')
+
+    return sql
+
+
+
+class OracleAoiStage:
+    _table_checked = False
+    _table_lock = threading.Lock()
+
+    def __init__(self, wkb_aoi, srid):
+        """
+        Initialize the OracleAoiStage of one AOI.
+
+        Args:
+            wkb_aoi (bytes): AOI geometry (WKB, 2D).
+            srid (int): SRID of the AOI.
+        """
+        self.wkb_aoi = wkb_aoi
+        self.srid = int(srid)
+        self.key = aoi_key(wkb_aoi, srid)
+        self.enabled = True
+        # sessions the AOI was staged in, by connection object (kept referenced so ids are not reused)
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+
+    def ensure_table(self, connection):
+        """Creates the staging table and its spatial index if they do not exist (once per process).
+           Staging is disabled if the table cannot be created, e.g. without the CREATE privileges."""
+        cls = type(self)
+        with cls._table_lock:
+            if cls._table_checked:
+                return self.enabled
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT COUNT(*) FROM USER_TABLES WHERE TABLE_NAME = :tab",
+                                   tab=STAGE_TABLE)
+                    if cursor.fetchone()[0] == 0:
+                        print(f'..creating the AOI staging table {STAGE_TABLE}')
+                        for ddl in ORACLE_DDL:
+                            cursor.execute(ddl)
+                        connection.commit()
+                cls._table_checked = True
+            except Exception as e:
+                print(f'..AOI staging disabled, the AOI will be sent with every query: {e}')
+                self.enabled = False
+
+        return self.enabled
+
+
+    def stage(self, connection, srid_t):
+        """
+        Inserts the AOI into the staging table of a session, unless the session has it already.
+        A session is checked in the database only the first time it is seen (a worker keeps its
+        session for the whole run); a new or reconnected session is probed with is_staged().
+
+        Args:
+            connection: Session that will run the staged overlay queries.
+            srid_t (int): SRID of the overlay table.
+
+        Returns:
+            bool: True if the staged query can be used for a table of this SRID.
+        """
+        if not self.enabled or int(srid_t) != STAGE_SRID:
+            return False
+
+        with self._lock:
+            if self._sessions.get(id(connection)) is connection:
+                return True
+
+        if not self.is_staged(connection):
+            self.insert(connection)
+
+        with self._lock:
+            self._sessions[id(connection)] = connection
+
+        return True
+
+
+    def is_staged(self, connection):
+        """Returns True if the AOI is in the staging table of a session. The temporary table rows
+           are private to the physical session, so a new or recycled session is always detected."""
+        cursor = connection.cursor()
+        try:
+            cursor.execute(f"SELECT COUNT(*) FROM {STAGE_TABLE} WHERE AOI_KEY = :aoi_key", {'aoi_key': self.key})
+            return cursor.fetchone()[0] > 0
+        finally:
+            cursor.close()
+
+
+    def insert(self, connection):
+        """Replaces the content of the staging table of a session by the AOI (in STAGE_SRID)"""
+        with connection.cursor() as cursor:
+            # clear the AOI of a previous run of the session
+            cursor.execute(f"DELETE FROM {STAGE_TABLE}")
+            if self.srid == STAGE_SRID:
+                shape = "SDO_GEOMETRY(:wkb_aoi, :srid)"
+            else:
+                shape = f"SDO_CS.TRANSFORM(SDO_GEOMETRY(:wkb_aoi, :srid), {STAGE_SRID})"
+            # large AOIs exceed the RAW bind limit
+            cursor.setinputsizes(wkb_aoi=oracledb.DB_TYPE_BLOB)
+            cursor.execute(f"INSERT INTO {STAGE_TABLE} (AOI_KEY, SRID, SHAPE) "
+                           f"VALUES (:aoi_key, {STAGE_SRID}, {shape})",
+                           aoi_key=self.key, wkb_aoi=self.wkb_aoi, srid=self.srid)
+        connection.commit()
+
+
+    def bind_vars(self, srid_t):
+        """Returns the AOI bind variables of the staged overlay queries"""
+        return {'aoi_key': self.key, 'srid_t': int(srid_t)}
+
+
+
+def _geom(value):
+    return shapely.from_wkb(bytes(value)) if value is not None else None
+
+
+def _sdo_distance(a, b, tolerance):
+    """SDO_GEOM.SDO_DISTANCE: distances within tolerance are 0"""
+    if a is None or b is None:
+        return None
+    distance = shapely.distance(_geom(a), _geom(b))
+
+    return 0.0 if distance <= tolerance else distance
+
+
+def _sdo_within_distance(a, b, params):
+    """SDO_WITHIN_DISTANCE with a 'distance = N' parameter string"""
+    if a is None or b is None:
+        return 'FALSE'
+    distance = float(re.search(r'distance\s*=\s*([\d.eE+-]+)', params).group(1))
+
+    return 'TRUE' if shapely.dwithin(_geom(a), _geom(b), distance) else 'FALSE'
+
+
+def sqlite_query(sql):
+    """Returns the SQLite version of an Oracle overlay query (for the registered SDO functions)"""
+    sql = sql.replace('SDO_GEOM.SDO_DISTANCE', 'SDO_DISTANCE')
+    sql = re.sub(r'SDO_UTIL\.TO_WK[BT]GEOMETRY', 'TO_WKBGEOMETRY', sql)
+
+    return sql
+
+
+def register_sdo_functions(connection):
+    """Registers shapely implementations of the SDO functions used by the overlay queries"""
+    connection.create_function('SDO_DISTANCE', 3, _sdo_distance, deterministic=True)
+    connection.create_function('SDO_WITHIN_DISTANCE', 3, _sdo_within_distance, deterministic=True)
+    connection.create_function('TO_WKBGEOMETRY', 1, lambda g: g, deterministic=True)
+    connection.create_function('TO_CHAR', 1, lambda x: None if x is None else str(x), deterministic=True)
+
+
+
+class SqliteAoiStage(OracleAoiStage):
+    """Local stand-in of OracleAoiStage on a SQLite connection: the staging table is a session
+       TEMP table of WKB geometries (no spatial index), filled by the same stage() logic."""
+
+    def ensure_table(self, connection):
+        register_sdo_functions(connection)
+        connection.execute(f"CREATE TEMP TABLE IF NOT EXISTS {STAGE_TABLE} "
+                           f"(AOI_KEY TEXT, SRID INTEGER, SHAPE BLOB)")
+
+        return self.enabled
+
+
+    def insert(self, connection):
+        shape = shapely.from_wkb(bytes(self.wkb_aoi))
+        if self.srid != STAGE_SRID:
+            # SDO_CS.TRANSFORM
+            transformer = Transformer.from_crs(self.srid, STAGE_SRID, always_xy=True)
+            shape = shapely.transform(shape, lambda xy: np.column_stack(transformer.transform(xy[:, 0], xy[:, 1])))
+        connection.execute(f"DELETE FROM {STAGE_TABLE}")
+        connection.execute(f"INSERT INTO {STAGE_TABLE} (AOI_KEY, SRID, SHAPE) VALUES (?, ?, ?)",
+                           (self.key, STAGE_SRID, sqlite3.Binary(shapely.to_wkb(shape))))
+        connection.commit()
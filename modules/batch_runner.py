@@ -0,0 +1,222 @@
+'''
+Batch runner for the AST.
+
+Runs many (crown_file_num, disp_num, parcel_num, feature) jobs in one
+process with a bounded worker pool. Jobs share the Oracle session pool
+and the parsed status spreadsheets, and a manifest of per-job status
+and timing is written when the batch completes.
+'''
+import os
+import re
+import csv
+import json
+import time
+import threading
+import traceback
+import pandas as pd
+import sys
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Use main scripts dir for the project path
+current_script_path = Path(__file__).resolve().parents[1]
+sys.path.append(str(current_script_path))
+
+from modules.connection_pool import get_session_pool
+from prelim.AST_outline import ASTProcessor
+
+from config import HOSTNAME
+
+
+JOB_FIELDS = ['crown_file_num', 'disp_num', 'parcel_num', 'feature']
+DEFAULT_MAX_WORKERS = 4
+
+
+def parse_job_number(value):
+    """Returns a job number as an int, also from spreadsheet exports ('907109.0', ' 907109 ')"""
+    value = str(value).strip()
+    if value.lstrip('+-').isdigit():
+        return int(value)
+
+    number = float(value)
+    if not number.is_integer():
+        raise ValueError(f'{value!r} is not a whole number')
+
+    return int(number)
+
+
+def parse_file_number(value):
+    """Returns a crown file number as text, without the '.0' of spreadsheet exports ('5406682.0')"""
+    value = str(value).strip()
+
+    return re.sub(r'^(\d+)\.0*$', r'\1', value)
+
+
+def read_jobs(jobs_file):
+    """
+    Reads batch jobs from a CSV or JSONL file.
+
+    Args:
+        jobs_file (str): Path to a .csv (with a header row) or .jsonl file.
+                         Recognized fields: job_id, crown_file_num, disp_num,
+                         parcel_num, feature, output_dir.
+
+    Returns:
+        list: One dict per job. A job with an invalid number gets an 'error' and is not run.
+    """
+    ext = os.path.splitext(jobs_file)[1].lower()
+
+    with open(jobs_file, newline='') as f:
+        if ext == '.csv':
+            rows = list(csv.DictReader(f))
+        elif ext in ('.jsonl', '.ndjson'):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            raise ValueError(f'Jobs file format not recognized: {jobs_file}. Please provide a csv or jsonl!')
+
+    jobs = []
+    for i, row in enumerate(rows, start=1):
+        job = {k: (None if row.get(k) in ('', None) else row.get(k)) for k in JOB_FIELDS}
+
+        job['error'] = None
+        for k in ('disp_num', 'parcel_num'):
+            if job[k] is not None:
+                try:
+                    job[k] = parse_job_number(job[k])
+                except ValueError as e:
+                    job['error'] = f'Invalid {k} on row {i}: {e}'
+        if job['crown_file_num'] is not None:
+            job['crown_file_num'] = parse_file_number(job['crown_file_num'])
+
+        job['job_id'] = str(row.get('job_id') or i)
+        job['output_dir'] = row.get('output_dir') or None
+        jobs.append(job)
+
+    return jobs
+
+
+
+class SharedCache:
+    """Thread-safe cache of values shared across batch jobs (spreadsheets, metadata, etc.).
+       Each key is built only once, even if several workers ask for it at the same time."""
+
+    def __init__(self):
+        self._values = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def get_or_create(self, key, factory):
+        """Returns the cached value for key, calling factory() to build it on first use"""
+        with self._lock:
+            if key in self._values:
+                return self._values[key]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                if key in self._values:
+                    return self._values[key]
+            value = factory()
+            with self._lock:
+                self._values[key] = value
+
+        return value
+
+
+
+class BatchRunner:
+    def __init__(self, jobs, output_dir, max_workers=DEFAULT_MAX_WORKERS, pool=None, logger=None):
+        """
+        Initialize the BatchRunner.
+
+        Args:
+            jobs (list): Job dicts, as returned by read_jobs().
+            output_dir (str): Base folder. Jobs without their own output_dir get a sub-folder here.
+            max_workers (int): Maximum number of reports running at the same time.
+            pool (SessionPool): Session pool shared by all jobs. Created if not provided.
+        """
+        self.jobs = jobs
+        self.output_dir = output_dir
+        self.max_workers = max_workers
+        self.pool = pool or get_session_pool(HOSTNAME, max_sessions=max(max_workers, 2))
+        self.logger = logger
+
+        self.shared_cache = SharedCache()
+        self.manifest = []
+
+
+    def job_output_dir(self, job):
+        """Returns the output folder of a job"""
+        if job['output_dir']:
+            return Path(job['output_dir'])
+
+        name = '_'.join(str(job[k]) for k in ('crown_file_num', 'disp_num', 'parcel_num')
+                        if job[k] is not None) or job['job_id']
+
+        return Path(self.output_dir) / name
+
+
+    def run_job(self, job):
+        """Runs a single report and returns its manifest record"""
+        record = {'job_id': job['job_id']}
+        record.update({k: job[k] for k in JOB_FIELDS})
+        record['output_dir'] = str(self.job_output_dir(job))
+
+        start_t = time.perf_counter()
+        record['started'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        if job.get('error'):
+            record['status'] = 'FAILED'
+            record['error'] = job['error']
+            record['elapsed_s'] = 0.0
+            return record
+
+        try:
+            processor = ASTProcessor(feature=job['feature'],
+                                     crown_file_num=job['crown_file_num'],
+                                     disp_num=job['disp_num'],
+                                     parcel_num=job['parcel_num'],
+                                     output_dir=self.job_output_dir(job),
+                                     connection=self.pool,
+                                     logger=self.logger,
+                                     shared_cache=self.shared_cache)
+            processor.main()
+            record['status'] = 'SUCCESS'
+            record['error'] = None
+
+        except Exception as e:
+            traceback.print_exc()
+            record['status'] = 'FAILED'
+            record['error'] = f'{type(e).__name__}: {e}'
+
+        record['elapsed_s'] = round(time.perf_counter() - start_t, 2)
+
+        return record
+
+
+    def run(self):
+        """Runs all jobs with a bounded worker pool. Returns the manifest records in job order."""
+        print(f'\nRunning {len(self.jobs)} jobs with {self.max_workers} workers')
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.run_job, job): i for i, job in enumerate(self.jobs)}
+
+            results = [None] * len(self.jobs)
+            for counter, future in enumerate(as_completed(futures), start=1):
+                record = future.result()
+                results[futures[future]] = record
+                print(f"..job {counter} of {len(self.jobs)} ({record['job_id']}): "
+                      f"{record['status']} in {record['elapsed_s']}s")
+
+        self.manifest = results
+
+        return self.manifest
+
+
+    def write_manifest(self, manifest_path=None):
+        """Writes the per-job status and timing manifest to csv. Returns its path."""
+        if manifest_path is None:
+            manifest_path = os.path.join(self.output_dir, 'batch_manifest.csv')
+
+        os.makedirs(os.path.dirname(os.path.abspath(manifest_path)), exist_ok=True)
+        pd.DataFrame(self.manifest).to_csv(manifest_path, index=False)
+
+        return manifest_path
@@ -0,0 +1,44 @@
+'''
+Helpers shared by the AST on-disk caches.
+'''
+import os
+import json
+import tempfile
+from pathlib import Path
+
+
+# Root folder of the local caches. Override with the AST_CACHE_DIR environment variable.
+CACHE_DIR = os.environ.get('AST_CACHE_DIR',
+                           os.path.join(Path(__file__).resolve().parents[1], 'cache'))
+
+
+def cache_path(*parts):
+    """Returns a path under the cache folder, creating its parent folder if needed"""
+    path = os.path.join(CACHE_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    return path
+
+
+def read_json(path, default=None):
+    """Returns the content of a json cache file, or default if missing or unreadable"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def write_json(path, data):
+    """Writes a json cache file atomically (readers never see a partial file)"""
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
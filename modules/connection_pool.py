@@ -0,0 +1,181 @@
+'''
+Shared Oracle session pool for the AST tools.
+
+One pool is created per process and handed to ASTProcessor,
+UniversalOverlapTool and the inactive dispositions step, so many
+reports can run on warm sessions instead of reconnecting every time.
+'''
+import os
+import time
+import threading
+import keyring
+import oracledb
+from getpass import getpass
+from contextlib import contextmanager
+
+
+DEFAULT_MIN_SESSIONS = 1
+DEFAULT_MAX_SESSIONS = 8
+DEFAULT_SESSION_INCREMENT = 1
+DEFAULT_STMT_CACHE_SIZE = 100
+DEFAULT_PING_INTERVAL = 60   # seconds a session can sit idle before it is pinged on acquire
+DEFAULT_ACQUIRE_TIMEOUT = 30 # seconds to wait for a free session
+
+
+class SessionPool:
+    def __init__(self, dsn, username=None, password=None,
+                 min_sessions=DEFAULT_MIN_SESSIONS,
+                 max_sessions=DEFAULT_MAX_SESSIONS,
+                 increment=DEFAULT_SESSION_INCREMENT,
+                 stmt_cache_size=DEFAULT_STMT_CACHE_SIZE,
+                 ping_interval=DEFAULT_PING_INTERVAL,
+                 acquire_timeout=DEFAULT_ACQUIRE_TIMEOUT,
+                 logger=None):
+        """
+        Initialize the SessionPool. The pool itself is opened lazily on first acquire.
+
+        Args:
+            dsn (str): Oracle connect string (e.g. config.HOSTNAME).
+            username (str): Database user. Defaults to the OS login.
+            password (str): Database password. Defaults to the keyring entry.
+            min_sessions (int): Sessions opened when the pool is created.
+            max_sessions (int): Upper bound of concurrent sessions.
+            increment (int): Sessions added each time the pool grows.
+            stmt_cache_size (int): Statement cache size of each session.
+            ping_interval (int): Idle seconds after which a session is health checked on acquire.
+            acquire_timeout (int): Seconds to wait for a free session before failing.
+        """
+        self.dsn = dsn
+        self.username = username
+        self.password = password
+        self.min_sessions = min_sessions
+        self.max_sessions = max_sessions
+        self.increment = increment
+        self.stmt_cache_size = stmt_cache_size
+        self.ping_interval = ping_interval
+        self.acquire_timeout = acquire_timeout
+        self.logger = logger
+
+        self.pool = None
+        self._lock = threading.Lock()
+        self._acquire_times = []
+        self._failed_pings = 0
+
+
+    @staticmethod
+    def get_credentials(username=None, password=None):
+        """Returns the BCGW username and password, from the keyring if not provided"""
+        dbkey = "BCGW"
+        username = username or os.getlogin()
+        if password is None:
+            if not keyring.get_credential(dbkey, username):
+                password = getpass("password:")
+            else:
+                password = keyring.get_password(dbkey, username)
+
+        return username, password
+
+
+    def open(self):
+        """Creates the underlying oracledb pool (once)"""
+        with self._lock:
+            if self.pool is None:
+                username, password = self.get_credentials(self.username, self.password)
+                try:
+                    self.pool = oracledb.create_pool(user=username,
+                                                     password=password,
+                                                     dsn=self.dsn,
+                                                     min=self.min_sessions,
+                                                     max=self.max_sessions,
+                                                     increment=self.increment,
+                                                     stmtcachesize=self.stmt_cache_size,
+                                                     ping_interval=self.ping_interval,
+                                                     getmode=oracledb.POOL_GETMODE_TIMEDWAIT,
+                                                     wait_timeout=self.acquire_timeout * 1000)
+                except Exception as e:
+                    raise Exception(f'....Connection pool failed! Please check your login parameters - {e}')
+                print(f"....Connection pool opened ({self.min_sessions}-{self.max_sessions} sessions)")
+
+        return self.pool
+
+
+    @contextmanager
+    def acquire(self, ping=False):
+        """
+        Yields a pooled connection and releases it back to the pool on exit.
+
+        Args:
+            ping (bool): Force a round-trip health check before handing out the session.
+                         Idle sessions are already checked by the pool after ping_interval.
+        """
+        pool = self.pool or self.open()
+
+        start_t = time.perf_counter()
+        connection = pool.acquire()
+        if ping:
+            try:
+                connection.ping()
+            except oracledb.Error:
+                # Dead session: drop it from the pool and take a fresh one
+                self._failed_pings += 1
+                pool.drop(connection)
+                connection = pool.acquire()
+        elapsed = time.perf_counter() - start_t
+
+        with self._lock:
+            self._acquire_times.append(elapsed)
+
+        try:
+            yield connection
+        finally:
+            pool.release(connection)
+
+
+    def stats(self):
+        """Returns a dict of pool usage and per-acquire timing statistics"""
+        with self._lock:
+            times = list(self._acquire_times)
+
+        stats = {'acquires': len(times),
+                 'acquire_total_s': round(sum(times), 4),
+                 'acquire_max_s': round(max(times), 4) if times else 0,
+                 'acquire_avg_s': round(sum(times) / len(times), 4) if times else 0,
+                 'failed_pings': self._failed_pings}
+
+        if self.pool is not None:
+            stats['opened'] = self.pool.opened
+            stats['busy'] = self.pool.busy
+
+        return stats
+
+
+    def close(self):
+        """Closes the pool and all of its sessions"""
+        with self._lock:
+            if self.pool is not None:
+                self.pool.close(force=True)
+                self.pool = None
+
+
+
+_shared_pool = None
+_shared_lock = threading.Lock()
+
+
+def get_session_pool(dsn, **kwargs):
+    """Returns the process-wide SessionPool, creating it on first call"""
+    global _shared_pool
+    with _shared_lock:
+        if _shared_pool is None:
+            _shared_pool = SessionPool(dsn, **kwargs)
+
+    return _shared_pool
+
+
+def close_session_pool():
+    """Closes the process-wide SessionPool (if any)"""
+    global _shared_pool
+    with _shared_lock:
+        if _shared_pool is not None:
+            _shared_pool.close()
+            _shared_pool = None
@@ -0,0 +1,132 @@
+'''
+Compiled dataset catalogue.
+
+The status spreadsheet is turned, in one pass, into a list of compact
+DatasetSpec objects holding everything the overlay queries and the HTML
+maps need per dataset (table, projected columns, label field, compiled
+definition query, radius, source type), so the per-dataset loops do not
+slice the spreadsheet DataFrame.
+'''
+import sys
+import pandas as pd
+from pathlib import Path
+
+# Use main scripts dir for the project path
+current_script_path = Path(__file__).resolve().parents[1]
+sys.path.append(str(current_script_path))
+
+from modules.def_query import parse_def_query, DefinitionQueryError
+
+
+SUMMARY_COLUMNS = ['Fields_to_Summarize'] + ['Fields_to_Summarize' + str(f) for f in range(2, 7)]
+
+
+class DatasetSpec:
+    """Everything needed to overlay and map one spreadsheet dataset"""
+    __slots__ = ('index', 'category', 'name', 'table', 'summary_fields', 'columns',
+                 'label_field', 'def_query', 'def_binds', 'where', 'radius', 'source_type', 'error')
+
+    def __init__(self, index, category, name, table, summary_fields, label_field, where, radius):
+        self.index = index
+        self.category = category
+        self.name = name
+        self.table = table
+        self.summary_fields = summary_fields
+        self.label_field = label_field
+        self.where = where          # definition query as written in the spreadsheet
+        self.radius = radius
+        self.def_query = " "
+        self.def_binds = {}
+        self.error = None
+
+        self.source_type = 'oracle' if table.startswith('WHSE') or table.startswith('REG') else 'file'
+
+        # projected columns: summary fields plus the label field
+        fields = list(summary_fields)
+        if label_field and label_field not in fields:
+            fields.append(label_field)
+
+        if self.source_type == 'oracle':
+            self.columns = ','.join('b.' + x for x in fields) or 'b.OBJECTID'
+            try:
+                self.def_query, self.def_binds = compile_def_query(where)
+            except DefinitionQueryError as e:
+                # reported when the dataset is overlaid; the other datasets still run
+                self.error = str(e)
+        else:
+            self.columns = fields
+
+    def __repr__(self):
+        return f"DatasetSpec({self.index}, {self.name!r}, {self.table!r}, {self.source_type})"
+
+
+def compile_def_query(def_query):
+    """
+    Returns the Oracle SQL condition (b. aliased, literals as bind variables) of a
+    spreadsheet definition query, and its bind variables.
+
+    Raises:
+        DefinitionQueryError: If the definition query is malformed.
+    """
+    if not def_query:
+        return " ", {}
+
+    sql, binds = parse_def_query(def_query, alias='b')
+
+    return 'AND (' + sql + ')', binds
+
+
+def _text(value):
+    """Returns a stripped string, or None for empty/missing spreadsheet cells"""
+    if value is None or (not isinstance(value, str) and pd.isnull(value)):
+        return None
+    value = str(value).strip()
+
+    return value if value and value != 'nan' else None
+
+
+def _radius(value):
+    try:
+        return 0 if pd.isnull(value) else int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def compile_dataset_specs(spreadsheet):
+    """
+    Compiles the status spreadsheet into a list of DatasetSpec, in spreadsheet order.
+
+    Args:
+        spreadsheet: Status spreadsheet DataFrame (named columns), the records
+                     returned by create_spreadsheet_json, or DatasetSpecs already compiled.
+
+    Returns:
+        list: DatasetSpec objects.
+    """
+    if isinstance(spreadsheet, list) and spreadsheet and isinstance(spreadsheet[0], DatasetSpec):
+        return list(spreadsheet)
+
+    if isinstance(spreadsheet, pd.DataFrame):
+        df = spreadsheet
+        n = len(df)
+        column = lambda name: df[name].tolist() if name in df.columns else [None] * n
+
+        categories = df['Category'].ffill().tolist() if 'Category' in df.columns else [None] * n
+        rows = zip(df.index.tolist(), categories,
+                   column('Featureclass_Name(valid characters only)'), column('Datasource'),
+                   zip(*(column(c) for c in SUMMARY_COLUMNS)),
+                   column('map_label_field'), column('Definition_Query'), column('Buffer_Distance'))
+    else:
+        summaries = [record['table_summary'] for record in spreadsheet]
+        rows = ((i, s.get('category'), s.get('feature_name'), s.get('table'), s.get('summary_fields', []),
+                 s.get('label_field'), s.get('query'), s.get('buffer'))
+                for i, s in enumerate(summaries))
+
+    specs = []
+    for index, category, name, table, fields, label, where, radius in rows:
+        # summary fields are column names: skip the numeric fill values of empty columns
+        fields = [f for f in (_text(x) for x in fields if isinstance(x, str)) if f is not None]
+        specs.append(DatasetSpec(index, category, _text(name), _text(table) or '',
+                                 fields, _text(label), _text(where), _radius(radius)))
+
+    return specs
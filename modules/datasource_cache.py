@@ -0,0 +1,123 @@
+'''
+Introspection cache of spreadsheet datasources.
+
+Each distinct datasource is opened once with GDAL/OGR to record its driver,
+SRID, geometry type, fields, extent and feature count. The results are
+persisted between runs; file datasources are re-opened only when their
+modification time or size changes.
+'''
+import os
+import sys
+import time
+import threading
+from osgeo import ogr
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+# Use main scripts dir for the project path
+current_script_path = Path(__file__).resolve().parents[1]
+sys.path.append(str(current_script_path))
+
+from modules.cache_utils import cache_path, read_json, write_json
+from modules.layer_snapshot import split_datasource, source_signature
+
+
+DEFAULT_TTL_DAYS = 30   # for datasources that are not local files (no mtime/size to check)
+DEFAULT_MAX_WORKERS = 8
+
+
+def open_datasource_info(datasource):
+    """Opens a datasource once with OGR and returns its description"""
+    path, layer_name = split_datasource(datasource)
+    info = {'driver': 'unknown', 'srid': None, 'geometry_type': None,
+            'fields': [], 'extent': None, 'feature_count': None}
+    try:
+        ds = ogr.Open(path)
+        if ds:
+            info['driver'] = ds.GetDriver().GetName()
+            layer = ds.GetLayerByName(layer_name) if layer_name else ds.GetLayer()
+            if layer:
+                spatial_ref = layer.GetSpatialRef()
+                if spatial_ref and spatial_ref.GetAuthorityCode(None):
+                    info['srid'] = int(spatial_ref.GetAuthorityCode(None))
+                info['geometry_type'] = ogr.GeometryTypeToName(layer.GetGeomType())
+                defn = layer.GetLayerDefn()
+                info['fields'] = [defn.GetFieldDefn(i).GetName() for i in range(defn.GetFieldCount())]
+                minx, maxx, miny, maxy = layer.GetExtent()
+                info['extent'] = [minx, miny, maxx, maxy]
+                info['feature_count'] = layer.GetFeatureCount()
+            ds = None
+    except Exception as e:
+        info['error'] = str(e)
+
+    return info
+
+
+def datasource_signature(datasource):
+    """Returns the mtime/size signature of a file datasource, or None for database tables"""
+    path = split_datasource(datasource)[0]
+    try:
+        return source_signature(path) if os.path.exists(path) else None
+    except OSError:
+        return None
+
+
+
+class DatasourceInfoCache:
+    def __init__(self, cache_file=None, ttl_days=DEFAULT_TTL_DAYS):
+        """
+        Initialize the DatasourceInfoCache and load the cache file (if any).
+
+        Args:
+            cache_file (str): Path of the json cache file.
+            ttl_days (float): Age after which non-file datasources are re-opened.
+        """
+        self.cache_file = cache_file or cache_path('datasource_info.json')
+        self.ttl = ttl_days * 86400
+        self._lock = threading.Lock()
+        self.entries = read_json(self.cache_file, default={})
+
+
+    @staticmethod
+    def key(datasource):
+        return datasource.strip().lower()
+
+
+    def is_fresh(self, entry, datasource):
+        if entry is None:
+            return False
+        if entry['signature'] is not None:
+            return entry['signature'] == datasource_signature(datasource)
+
+        return (time.time() - entry['cached_at']) < self.ttl
+
+
+    def get(self, datasource):
+        """Returns the description of a datasource, opening it only if not cached or changed"""
+        with self._lock:
+            entry = self.entries.get(self.key(datasource))
+        if self.is_fresh(entry, datasource):
+            return entry
+
+        entry = open_datasource_info(datasource)
+        entry['signature'] = datasource_signature(datasource)
+        entry['cached_at'] = time.time()
+        with self._lock:
+            self.entries[self.key(datasource)] = entry
+
+        return entry
+
+
+    def fill(self, datasources, max_workers=DEFAULT_MAX_WORKERS):
+        """Caches all distinct datasources in parallel (opens are I/O bound) and saves the cache"""
+        distinct = list(dict.fromkeys(ds.strip() for ds in datasources if ds))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(self.get, distinct))
+        self.save()
+
+
+    def save(self):
+        """Writes the cache to disk"""
+        with self._lock:
+            entries = dict(self.entries)
+        write_json(self.cache_file, entries)
@@ -0,0 +1,286 @@
+'''
+Parser for the definition queries of the status spreadsheets.
+
+Definition queries are SQL-like filters written against a single table, e.g.
+    "TENURE_STATUS" = 'ACTIVE' AND (AREA_HA > 10 OR UPPER(NAME) LIKE 'BC%')
+
+compile_def_query parses them into Oracle SQL where every column is aliased
+to the overlay table (b.) and every literal is pulled out into a bind
+variable (:dq0, :dq1, ...). Two queries of the same shape produce the same
+SQL text, so the statement is reused from the statement cache. Malformed
+queries raise DefinitionQueryError before anything is sent to the database.
+
+Quoted identifiers ("MY FIELD") are kept quoted, so names with spaces,
+lowercase letters or reserved words stay valid. String literals are bound
+as VARCHAR2: compared with a CHAR column, Oracle then uses non-padded
+semantics instead of the blank-padded semantics of a text literal, so
+FIELD = 'X' does not match a CHAR(3) value 'X  '. Definition queries on
+CHAR columns should trim the column: RTRIM(FIELD) = 'X'.
+'''
+import re
+
+
+KEYWORDS = {'AND', 'OR', 'NOT', 'IN', 'LIKE', 'IS', 'NULL', 'BETWEEN', 'ESCAPE'}
+
+# functions allowed in definition queries
+FUNCTIONS = {'UPPER', 'LOWER', 'TRIM', 'LTRIM', 'RTRIM', 'SUBSTR', 'INSTR', 'LENGTH',
+             'NVL', 'COALESCE', 'TO_CHAR', 'TO_NUMBER', 'TO_DATE', 'TRUNC', 'ROUND',
+             'ABS', 'FLOOR', 'CEIL', 'MOD', 'REPLACE', 'CONCAT'}
+
+# pseudo-columns that must not be aliased
+PSEUDO_COLUMNS = {'SYSDATE', 'SYSTIMESTAMP', 'CURRENT_DATE'}
+
+COMPARISON_OPS = {'=', '<>', '!=', '^=', '<', '>', '<=', '>='}
+ARITHMETIC_OPS = {'+', '-', '*', '/', '||'}
+
+TOKEN_RE = re.compile(r"""
+      (?P<ws>\s+)
+    | (?P<string>'(?:[^']|'')*')
+    | (?P<qident>"[^"]+")
+    | (?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?)
+    | (?P<ident>[A-Za-z_][A-Za-z0-9_$#]*(?:\.[A-Za-z_][A-Za-z0-9_$#]*)?)
+    | (?P<op><>|!=|\^=|<=|>=|\|\||[=<>+\-*/])
+    | (?P<punct>[(),])
+    """, re.VERBOSE)
+
+
+class DefinitionQueryError(ValueError):
+    """Raised when a spreadsheet definition query cannot be parsed"""
+
+
+
+def tokenize(text):
+    """Returns a list of (kind, value) tokens"""
+    tokens = []
+    pos = 0
+    while pos < len(text):
+        m = TOKEN_RE.match(text, pos)
+        if not m:
+            raise DefinitionQueryError(f'Unexpected character {text[pos]!r} at position {pos}: {text}')
+        pos = m.end()
+        kind = m.lastgroup
+        value = m.group()
+        if kind == 'ws':
+            continue
+        if kind == 'qident':
+            value = value[1:-1]
+        if kind == 'ident' and value.upper() in KEYWORDS:
+            kind, value = 'kw', value.upper()
+        tokens.append((kind, value))
+
+    return tokens
+
+
+
+class _Parser:
+    """Recursive descent parser emitting aliased SQL and bind variables"""
+
+    def __init__(self, text, alias, bind_prefix):
+        self.text = text
+        self.tokens = tokenize(text)
+        self.pos = 0
+        self.alias = alias
+        self.bind_prefix = bind_prefix
+        self.binds = {}
+
+    # -- token helpers
+    def peek(self, offset=0):
+        i = self.pos + offset
+        return self.tokens[i] if i < len(self.tokens) else (None, None)
+
+    def next(self):
+        token = self.peek()
+        if token[0] is None:
+            self.error('Unexpected end of query')
+        self.pos += 1
+        return token
+
+    def accept(self, kind, value=None):
+        k, v = self.peek()
+        if k == kind and (value is None or v == value):
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, kind, value=None):
+        if not self.accept(kind, value):
+            self.error(f'Expected {value or kind}')
+
+    def error(self, message):
+        k, v = self.peek()
+        where = f'near {v!r}' if v is not None else 'at end'
+        raise DefinitionQueryError(f'{message} {where}: {self.text}')
+
+    def bind(self, value):
+        name = f'{self.bind_prefix}{len(self.binds)}'
+        self.binds[name] = value
+        return ':' + name
+
+    # -- grammar
+    def parse(self):
+        if not self.tokens:
+            raise DefinitionQueryError('Empty definition query')
+        sql = self.or_expr()
+        if self.peek()[0] is not None:
+            self.error('Unexpected token')
+        return sql
+
+    def or_expr(self):
+        parts = [self.and_expr()]
+        while self.accept('kw', 'OR'):
+            parts.append(self.and_expr())
+        return ' OR '.join(parts)
+
+    def and_expr(self):
+        parts = [self.not_expr()]
+        while self.accept('kw', 'AND'):
+            parts.append(self.not_expr())
+        return ' AND '.join(parts)
+
+    def not_expr(self):
+        if self.accept('kw', 'NOT'):
+            return 'NOT ' + self.not_expr()
+        return self.predicate()
+
+    def predicate(self):
+        # parenthesized condition, e.g. (A = 1 OR B = 2)
+        if self.peek() == ('punct', '(') and self.is_condition_group():
+            self.next()
+            sql = self.or_expr()
+            self.expect('punct', ')')
+            return '(' + sql + ')'
+
+        left = self.value_expr()
+        kind, value = self.peek()
+
+        if kind == 'op' and value in COMPARISON_OPS:
+            self.next()
+            return f'{left} {value} {self.value_expr()}'
+
+        negate = ''
+        if self.accept('kw', 'NOT'):
+            negate = 'NOT '
+            kind, value = self.peek()
+
+        if self.accept('kw', 'IN'):
+            self.expect('punct', '(')
+            items = [self.value_expr()]
+            while self.accept('punct', ','):
+                items.append(self.value_expr())
+            self.expect('punct', ')')
+            return f'{left} {negate}IN (' + ', '.join(items) + ')'
+
+        if self.accept('kw', 'LIKE'):
+            sql = f'{left} {negate}LIKE {self.value_expr()}'
+            if self.accept('kw', 'ESCAPE'):
+                sql += f' ESCAPE {self.value_expr()}'
+            return sql
+
+        if self.accept('kw', 'BETWEEN'):
+            low = self.value_expr()
+            self.expect('kw', 'AND')
+            return f'{left} {negate}BETWEEN {low} AND {self.value_expr()}'
+
+        if not negate and self.accept('kw', 'IS'):
+            is_not = 'NOT ' if self.accept('kw', 'NOT') else ''
+            self.expect('kw', 'NULL')
+            return f'{left} IS {is_not}NULL'
+
+        self.error('Expected a comparison')
+
+    def is_condition_group(self):
+        """True if the '(' at the current position opens a condition rather than a value"""
+        depth = 0
+        for kind, value in self.tokens[self.pos:]:
+            if (kind, value) == ('punct', '('):
+                depth += 1
+            elif (kind, value) == ('punct', ')'):
+                depth -= 1
+                if depth == 0:
+                    return False
+            elif depth >= 1 and (kind == 'kw' and value in ('AND', 'OR', 'NOT', 'IN', 'LIKE', 'IS', 'BETWEEN')
+                                 or kind == 'op' and value in COMPARISON_OPS):
+                return True
+        return False
+
+    def value_expr(self):
+        sql = self.term()
+        while self.peek()[0] == 'op' and self.peek()[1] in ARITHMETIC_OPS:
+            op = self.next()[1]
+            sql += f' {op} {self.term()}'
+        return sql
+
+    def term(self):
+        kind, value = self.next()
+
+        if kind == 'string':
+            return self.bind(value[1:-1].replace("''", "'"))
+
+        if kind == 'number':
+            number = float(value) if re.search(r'[.eE]', value) else int(value)
+            return self.bind(number)
+
+        if kind == 'op' and value == '-':
+            return '-' + self.term()
+
+        if kind == 'punct' and value == '(':
+            sql = self.value_expr()
+            self.expect('punct', ')')
+            return '(' + sql + ')'
+
+        if kind == 'qident':
+            # quoted column: case and characters kept as written
+            column = f'"{value}"'
+            return f'{self.alias}.{column}' if self.alias else column
+
+        if kind == 'ident':
+            name = value.upper()
+            if name in ('DATE', 'TIMESTAMP') and self.peek()[0] == 'string':
+                # typed literal: DATE '2020-01-01' -> TO_DATE(:dq0, 'YYYY-MM-DD')
+                literal = self.next()[1][1:-1]
+                fmt = 'YYYY-MM-DD' if name == 'DATE' else 'YYYY-MM-DD HH24:MI:SS'
+                return f"TO_DATE({self.bind(literal)}, '{fmt}')" if name == 'DATE' \
+                    else f"TO_TIMESTAMP({self.bind(literal)}, '{fmt}')"
+
+            if self.peek() == ('punct', '('):
+                if name not in FUNCTIONS:
+                    self.error(f'Function {value} is not allowed')
+                self.next()
+                args = []
+                if not self.accept('punct', ')'):
+                    args.append(self.value_expr())
+                    while self.accept('punct', ','):
+                        args.append(self.value_expr())
+                    self.expect('punct', ')')
+                return f'{name}(' + ', '.join(args) + ')'
+
+            if name in PSEUDO_COLUMNS:
+                return name
+
+            column = value.split('.')[-1]
+            return f'{self.alias}.{column}' if self.alias else column
+
+        self.pos -= 1
+        self.error('Expected a column, literal or function')
+
+
+
+def parse_def_query(text, alias='b', bind_prefix='dq'):
+    """
+    Parses a spreadsheet definition query.
+
+    Args:
+        text (str): Definition query as written in the spreadsheet.
+        alias (str): Alias prefixed to every column ('' for none).
+        bind_prefix (str): Prefix of the bind variable names.
+
+    Returns:
+        tuple: (SQL condition, dict of bind variables).
+
+    Raises:
+        DefinitionQueryError: If the query is malformed.
+    """
+    parser = _Parser(text, alias, bind_prefix)
+    sql = parser.parse()
+
+    return sql, parser.binds
@@ -7,32 +7,277 @@ import warnings
 warnings.simplefilter(action='ignore')
 
 import os
+import sys
 import timeit
+import json
+import zlib
 import base64
+import shutil
 import numpy as np
 import pandas as pd
 import geopandas as gpd
-import fiona
-import shapely.wkt as wkt
+import shapely
+import pyogrio
 import folium
 from folium.plugins import MeasureControl, MousePosition,FloatImage, MiniMap, Search, GroupedLayerControl
+from folium.plugins import VectorGridProtobuf
+from folium.utilities import get_obj_in_upper_tree
 from branca.element import Template, MacroElement
+from pyproj import Transformer
+from pathlib import Path
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
 
 import mapstyle
 
+# Use main scripts dir for the project path
+current_script_path = Path(__file__).resolve().parents[1]
+sys.path.append(str(current_script_path))
+
+from modules.spreadsheet_catalogue import read_workbook, read_compiled
+from modules.dataset_catalogue import compile_dataset_specs
+
+
+BUFFER_LAYERS = ['aoi_500', 'aoi_1000', 'aoi_5000']
+
+# Compact output (see HTMLGenerator compact)
+COMPACT_ZOOM = 17          # most detailed zoom level the geometries are simplified for
+COMPACT_PRECISION = 6      # decimals of the coordinates (about 0.1 m)
+SIDECAR_DIR = 'map_data'   # folder of the sidecar scripts, next to the maps
+AOI_SIDECAR = 'aoi_layers'
+
+# Tiled output (see HTMLGenerator tile_threshold)
+TILE_DIR = 'tiles'         # folder of the tile pyramids, in SIDECAR_DIR
+TILE_MINZOOM = 10
+TILE_MAXZOOM = 16          # tiles are overzoomed beyond
+LEGEND_MAX_ITEMS = 100     # legend entries of a tiled layer
+
+# Deterministic palette of the feature colors (channels 16-255, like the former random colors)
+PALETTE = np.array(['#{:02X}{:02X}{:02X}'.format(*rgb)
+                    for rgb in np.random.default_rng(2024).integers(16, 256, size=(256, 3))], dtype=object)
+POPUP_WIDTH = 20           # popup values are wrapped at this width
+
+
+def read_layer(path, layer):
+    """Reads a layer through pyogrio's Arrow interface, with 2D geometries (Folium doesn't like 3D)"""
+    gdf = pyogrio.read_dataframe(path, layer=layer, use_arrow=True)
+    if gdf.shape[0] and gdf.geometry.has_z.any():
+        gdf['geometry'] = shapely.force_2d(gdf.geometry.values)
+
+    return gdf
+
+
+@lru_cache(maxsize=None)
+def wgs84_transformer(crs):
+    """Returns the transformer of a CRS to EPSG:4326 (created once per CRS)"""
+    return Transformer.from_crs(crs, 'EPSG:4326', always_xy=True)
+
+
+def to_wgs84(gdf):
+    """Returns a gdf reprojected to EPSG:4326 with the cached transformer of its CRS"""
+    transformer = wgs84_transformer(gdf.crs)
+    geoms = shapely.transform(gdf.geometry.values,
+                              lambda xy: np.column_stack(transformer.transform(xy[:, 0], xy[:, 1])))
+
+    return gdf.set_geometry(gpd.GeoSeries(geoms, index=gdf.index, crs='EPSG:4326'))
+
+
+def palette_colors(n, key):
+    """Returns n colors of the palette, starting at a position given by a key (the layer name)"""
+    start = zlib.crc32(key.encode('utf-8'))
+
+    return PALETTE[(start + np.arange(n)) % len(PALETTE)]
+
+
+def wrap_values(values, width=POPUP_WIDTH):
+    """Wraps string values at width with <br> line breaks. Only the values that wrapping
+       changes (long, or with whitespace to normalize) go through textwrap."""
+    changed = (values.str.len() > width) | values.str.contains(r'^\s|\s$|[\t\n\r\x0b\x0c]', regex=True)
+    if changed.any():
+        values = values.copy()
+        values[changed] = values[changed].str.wrap(width=width).str.replace('\n', '<br>')
+
+    return values
+
+
+def zoom_tolerance(zoom, lat):
+    """Returns the size of a screen pixel at a web map zoom level, in degrees at a latitude"""
+    return 360 / (256 * 2 ** zoom) * np.cos(np.radians(lat))
+
+
+def compact_geojson(gdf, tolerance, precision=COMPACT_PRECISION):
+    """
+    Returns the GeoJSON of an EPSG:4326 gdf, with the geometries simplified by tolerance
+    and the coordinates rounded to precision decimals.
+    """
+    geoms = shapely.simplify(gdf.geometry.values, tolerance, preserve_topology=True)
+    # numpy rounding (unlike a precision grid) keeps the serialized decimals short
+    geoms = shapely.transform(geoms, lambda coords: np.round(coords, precision))
+    gdf = gdf.set_geometry(gpd.GeoSeries(geoms, index=gdf.index, crs=gdf.crs))
+
+    return gdf.to_json(show_bbox=True, drop_id=True, separators=(',', ':'))
+
+
+def write_sidecar(out_loc, name, layers):
+    """
+    Writes serialized GeoJSON layers to a sidecar script read by the maps (<script src> also
+    works for maps opened from disk, where fetching a .geojson file is blocked).
+
+    Args:
+        layers (dict): GeoJSON strings by data key.
+    """
+    os.makedirs(os.path.join(out_loc, SIDECAR_DIR), exist_ok=True)
+    with open(os.path.join(out_loc, SIDECAR_DIR, name + '.js'), 'w', encoding='utf-8') as f:
+        f.write('var AST_DATA = AST_DATA || {};\n')
+        for key, geojson in layers.items():
+            f.write(f'AST_DATA[{json.dumps(key)}] = {geojson};\n')
+
+
+def write_vector_tiles(gdf, out_loc, name, minzoom=TILE_MINZOOM, maxzoom=TILE_MAXZOOM):
+    """
+    Writes an EPSG:4326 layer as a Mapbox vector tile pyramid ({z}/{x}/{y}.pbf, GDAL MVT driver)
+    named after the layer. Returns the url template of the tiles, relative to the maps.
+    """
+    tile_root = os.path.join(out_loc, SIDECAR_DIR, TILE_DIR)
+    os.makedirs(tile_root, exist_ok=True)
+    path = os.path.join(tile_root, name)
+    if os.path.exists(path):
+        shutil.rmtree(path)   # the driver does not write into an existing pyramid
+
+    pyogrio.write_dataframe(gdf, path, driver='MVT', layer=name,
+                            dataset_options={'FORMAT': 'DIRECTORY', 'MINZOOM': minzoom, 'MAXZOOM': maxzoom,
+                                             'COMPRESS': 'NO', 'TILE_EXTENSION': 'pbf'})
+
+    return f'{SIDECAR_DIR}/{TILE_DIR}/{name}/{{z}}/{{x}}/{{y}}.pbf'
+
+
+def style_js(style):
+    """Returns the JS expression of a style dict (values starting with 'feature.' are read from the feature)"""
+    return '{' + ', '.join(f'{k}: {v if str(v).startswith("feature.") else json.dumps(v)}'
+                           for k, v in style.items()) + '}'
+
+
+def add_sidecar(map_obj, name):
+    """References a sidecar script in a map"""
+    map_obj.get_root().header.add_child(
+        folium.Element(f'<script src="{SIDECAR_DIR}/{name}.js"></script>'), name='sidecar_' + name)
+
+
+class SidecarGeoJson(folium.GeoJson):
+    """
+    GeoJson layer reading its features from a sidecar script (AST_DATA[data_key]) instead of
+    embedding them in the map. Styles are one JS expression of the feature rather than
+    a style per feature.
+
+    Args:
+        data_key (str): Key of the layer in the sidecar script.
+        fields (list): Property names of the features (checked by the tooltip and popup).
+        style (str): JS expression of the feature style, e.g. "{color: feature.properties.color}".
+    """
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = L.geoJson(AST_DATA[{{ this.data_key|tojson }}], {
+            style: function(feature) { return {{ this.style_js }}; },
+            pointToLayer: function(feature, latlng) { return L.circle(latlng, {radius: 5}); },
+        });
+        {% endmacro %}
+        """)
+
+    def __init__(self, data_key, fields, style, name=None, show=True, tooltip=None, popup=None):
+        stub = {'type': 'FeatureCollection',
+                'features': [{'type': 'Feature', 'properties': dict.fromkeys(fields), 'geometry': None}]}
+        super().__init__(data=stub, name=name, show=show, tooltip=tooltip, popup=popup)
+        self.data_key = data_key
+        self.style_js = style
+
+
+class VectorTileLayer(VectorGridProtobuf):
+    """
+    Layer of a vector tile pyramid (see write_vector_tiles), drawn on canvas and loaded tile by
+    tile as the map is panned. Clicking a feature opens a popup of its fields.
+
+    Args:
+        url (str): Url template of the tiles.
+        layer_name (str): Name of the layer in the tiles.
+        fields (list): Properties shown in the popup.
+        aliases (list): Labels of the fields.
+        style (str): JS expression of the feature style (see style_js).
+    """
+    _template = Template("""
+        {% macro script(this, kwargs) -%}
+        var {{ this.get_name() }} = L.vectorGrid.protobuf({{ this.url|tojson }}, {
+            rendererFactory: L.canvas.tile,
+            interactive: true,
+            minZoom: {{ this.min_zoom }},
+            maxNativeZoom: {{ this.max_native_zoom }},
+            vectorTileLayerStyles: {
+                {{ this.layer_name|tojson }}: function(properties, zoom) {
+                    var feature = {properties: properties};
+                    return {{ this.style_js }};
+                }
+            }
+        });
+        {{ this.get_name() }}.on('click', function(e) {
+            var fields = {{ this.fields|tojson }};
+            var aliases = {{ this.aliases|tojson }};
+            var table = '<table>' + fields.map(function(v, i) {
+                return '<tr><th>' + aliases[i] + '</th><td>' + e.layer.properties[v] + '</td></tr>';
+            }).join('') + '</table>';
+            L.popup({maxWidth: 380}).setLatLng(e.latlng).setContent(table).openOn({{ this.parent_map.get_name() }});
+        });
+        {%- endmacro %}
+        """)
+
+    def __init__(self, url, layer_name, fields, aliases, style, name=None, show=True,
+                 min_zoom=TILE_MINZOOM, max_native_zoom=TILE_MAXZOOM):
+        super().__init__(url, name=name, show=show)
+        self.layer_name = layer_name
+        self.fields = fields
+        self.aliases = aliases
+        self.style_js = style
+        self.min_zoom = min_zoom
+        self.max_native_zoom = max_native_zoom
+        self.parent_map = None
+
+    def render(self, **kwargs):
+        self.parent_map = get_obj_in_upper_tree(self, folium.Map)
+        super().render(**kwargs)
+
 
 class HTMLGenerator:
-    def __init__(self, common_xls, region_xls, status_gdb, out_location):
+    def __init__(self, common_xls, region_xls, status_gdb, out_location, max_workers=1, compact=False,
+                 tile_threshold=None):
+        """
+        Initialize the HTMLGenerator.
+
+        Args:
+            max_workers (int): Processes rendering the individual maps (1 renders them in this process).
+            compact (bool): Simplify the geometries for COMPACT_ZOOM, round their coordinates and write
+                            them once to sidecar scripts shared by the maps, instead of embedding the
+                            AOI layers in every map and every layer twice.
+            tile_threshold (int): Layers with more features are written as vector tiles loaded on demand,
+                                  instead of inline GeoJSON (None: never). The maps of tiled layers must
+                                  be opened through a web server: browsers block tile requests from disk.
+        """
         self.status_gdb = status_gdb
         self.out_loc = out_location
         self.common_xls = common_xls
         self.region_xls = region_xls
+        self.max_workers = max_workers
+        self.compact = compact
+        self.tile_threshold = tile_threshold
+
+        # AOI and buffer layers shared by all the maps (see prepare_aoi_layers)
+        self.aoi_layers = None
+        self.center = None
+        self.aoi_bounds = None
+        self.tolerance = None
 
 
     def get_input_xlsx(self):
         """returns a dataframe of status input xlsxs """
-        df_stat_c = pd.read_excel(self.common_xls)
-        df_stat_r = pd.read_excel(self.region_xls)
+        df_stat_c = read_workbook(self.common_xls)
+        df_stat_r = read_workbook(self.region_xls)
         
         df_stat = pd.concat([df_stat_c, df_stat_r])
         df_stat.dropna(how='all', inplace=True)
@@ -44,6 +289,16 @@ class HTMLGenerator:
         return df_stat
 
 
+    def get_catalogue(self):
+        """returns the status dataframe and its DatasetSpecs, from the catalogue cache unless
+           the input xlsxs changed"""
+        def compile_catalogue():
+            df_stat = self.get_input_xlsx()
+            return df_stat, compile_dataset_specs(df_stat)
+
+        return read_compiled([self.common_xls, self.region_xls], 'html_catalogue', compile_catalogue)
+
+
     def create_map_template(self, title='Placeholder for title',Xcenter=0,Ycenter=0):
         """Returns an empty folium map object"""
         # Create a map object
@@ -117,56 +372,327 @@ class HTMLGenerator:
         return map_obj
 
 
-    def generate_html_maps(self):
-        """Creates a HTML map for each feature class in gdb"""
-
-        print('\nReading input xlsxs')
-        df_st= self.get_input_xlsx()
-        
-        print ('\nPreparing Layers for mapping')
+    def prepare_aoi_layers(self):
+        """Reads the AOI, buffers it and serializes the AOI and buffer layers (EPSG:4326 GeoJSON)
+           once, for the all-layers map and every individual map"""
         # Read the AOI feature class into a gdf 
-        gdf_aoi = gpd.read_file(filename=self.status_gdb, layer= 'aoi')
+        gdf_aoi = read_layer(self.status_gdb, 'aoi')
         
         # Create a dict of buffered gdfs
         bf_gdfs= {'aoi_500': gpd.GeoDataFrame(geometry= gdf_aoi.buffer(500), crs= gdf_aoi.crs), 
                   'aoi_1000': gpd.GeoDataFrame(geometry= gdf_aoi.buffer(1000), crs= gdf_aoi.crs), 
                   'aoi_5000': gpd.GeoDataFrame(geometry= gdf_aoi.buffer(5000), crs= gdf_aoi.crs) 
                   }
-        
-        print ('\nCreating a map template')
-        # Create an all-layers map
-        centroids = gdf_aoi.to_crs(4326).centroid
-        Xcenter = centroids.x[0]
-        Ycenter = centroids.y[0]
-        
-        map_all = self.create_map_template(title='Overview Map - All Overlaps',
-                                    Xcenter=Xcenter,Ycenter=Ycenter)
-             
-        # Add the AOI layer to the all-layers map
+
+        gdf_aoi = to_wgs84(gdf_aoi)
+        bf_gdfs = {k: to_wgs84(v) for k,v in bf_gdfs.items()}
+
+        centroids = gdf_aoi.centroid
+        self.center = (centroids.x[0], centroids.y[0])
+        self.aoi_bounds = bf_gdfs.get('aoi_1000')['geometry'].total_bounds
+        if self.compact:
+            self.tolerance = zoom_tolerance(COMPACT_ZOOM, self.center[1])
+
+        self.aoi_layers = {'AOI': self.layer_geojson(gdf_aoi)}
+        for k,v in bf_gdfs.items():
+            self.aoi_layers[k] = self.layer_geojson(v)
+
+        if self.compact:
+            write_sidecar(self.out_loc, AOI_SIDECAR, self.aoi_layers)
+
+
+    def layer_geojson(self, gdf):
+        """Serializes an EPSG:4326 layer (compacted in compact mode)"""
+        if self.compact:
+            return compact_geojson(gdf, self.tolerance)
+
+        return gdf.to_json(show_bbox=True)
+
+
+    def geojson_layer(self, data, data_key, fields, style, name, show=True, tooltip=None, popup=None,
+                      marker=None):
+        """
+        Returns the folium layer of a serialized layer: embedded in the map, or read from
+        its sidecar script in compact mode.
+
+        Args:
+            style (dict): Style of the features; values starting with 'feature.' are read from the features.
+        """
+        if self.compact:
+            return SidecarGeoJson(data_key, fields, style_js(style), name=name, show=show,
+                                  tooltip=tooltip, popup=popup)
+
+        def style_function(x):
+            return {k: x['properties'][v[19:]] if str(v).startswith('feature.properties.') else v
+                    for k, v in style.items()}
+
+        return folium.GeoJson(data=data, name=name, show=show, marker=marker,
+                              style_function=style_function, tooltip=tooltip, popup=popup)
+
+
+    def overlap_layer(self, result, color_col, name, show=True):
+        """
+        Returns the folium layer of an overlap layer rendered by render_layer_map: vector tiles
+        for a tiled layer, GeoJSON otherwise.
+
+        Args:
+            color_col (str): Property holding the feature colors ('color' or 'color2' for the all-layers map).
+        """
+        label_col = result['label_col']
+        color = 'feature.properties.' + color_col
+        style = {'fillColor': color, 'color': color, 'weight': 2}
+
+        if result['tiles']:
+            fields = result['tooltip_cols'] + [c for c in result['popup_cols'] if c != label_col]
+            aliases = ['LAYER', label_col] + fields[2:]
+            return VectorTileLayer(result['tiles'], result['data_key'], fields, aliases, style_js(style),
+                                   name=name, show=show)
+
+        return self.geojson_layer(result['geojson'], result['data_key'], result['fields'],
+                    name=name,
+                    marker=folium.Circle(radius=5),
+                    style=style,
+                    tooltip=folium.features.GeoJsonTooltip(fields=result['tooltip_cols'],
+                                                            aliases=['LAYER', label_col],
+                                                            labels=True),
+                    popup=folium.features.GeoJsonPopup(fields=result['popup_cols'], 
+                                                        sticky=False,
+                                                        max_width=380))
+
+
+    def add_aoi_layers(self, map_obj):
+        """Adds the AOI and buffer layers to a map. Returns their feature groups."""
+        if self.compact:
+            add_sidecar(map_obj, AOI_SIDECAR)
+
         grp_aoi= folium.FeatureGroup(name= 'AOI')  
-        lyr_aoi= folium.GeoJson(data=gdf_aoi, name='AOI',
-                    style_function=lambda x:{'color': 'red', 
-                                                'fillColor': 'none',
-                                                'weight': 3})
+        lyr_aoi= self.geojson_layer(self.aoi_layers['AOI'], 'AOI', [], name='AOI',
+                    style={'color': 'red', 
+                           'fillColor': 'none',
+                           'weight': 3})
         lyr_aoi.add_to(grp_aoi)
-        grp_aoi.add_to(map_all)
+        grp_aoi.add_to(map_obj)
         
         aoi_grps= [grp_aoi]
         
-        # Add buffered areas to the all-layers map
-        for k,v in bf_gdfs.items():
+        for k in BUFFER_LAYERS:
             grp_aoi_b= folium.FeatureGroup(name= k.upper()+' m')  
-            lyr_aoi_b= folium.GeoJson(data=v, name=k, show=True,
-                            style_function=lambda x:{'color': 'orange',
-                                                     'fillColor': 'none',
-                                                     'weight': 3})
+            lyr_aoi_b= self.geojson_layer(self.aoi_layers[k], k, [], name=k, show=True,
+                            style={'color': 'orange',
+                                   'fillColor': 'none',
+                                   'weight': 3})
             lyr_aoi_b.add_to(grp_aoi_b)
-            grp_aoi_b.add_to(map_all)
+            grp_aoi_b.add_to(map_obj)
         
             aoi_grps.append(grp_aoi_b)
+
+        return aoi_grps
+
+
+    def render_layer_map(self, spec, fc):
+        """
+        Reads a feature class of the status gdb and saves its individual map.
+
+        Returns:
+            dict: What the all-layers map needs (title, EPSG:4326 GeoJSON, label and popup columns),
+                  or None if the feature class is empty.
+        """
+        Xcenter, Ycenter = self.center
+
+        gdf_fc = read_layer(self.status_gdb, fc)
+
+        if gdf_fc.shape[0] == 0:
+            return None
+
+        #convert all cols to str except geometry
+        attr_cols = [col for col in gdf_fc.columns if col != 'geometry']
+        gdf_fc[attr_cols] = gdf_fc[attr_cols].astype(str)
+            
+        # Set label column. Will be used for tooltip and legend.
+        map_title = fc.replace('_', ' ')
+
+        label_col= spec.label_field
+
+        if label_col is None and spec.summary_fields:
+            label_col= spec.summary_fields[0]
+        
+        if label_col is None:
+            label_col = gdf_fc.columns[0]
+            
+        # Set pop up columns
+        popup_cols = list(spec.summary_fields)
+
+        if len(popup_cols) == 0:
+            popup_cols = [col for col in gdf_fc.columns if col != 'geometry'] 
+        
+        # Format the popup columns for better visulization
+        for col in popup_cols:
+            gdf_fc[col] = wrap_values(gdf_fc[col].astype(str))
+        
+        
+        # Assign palette colors to the features (for legend), and one to the layer
+        colors = palette_colors(gdf_fc.shape[0], fc)
+        gdf_fc['color'] = colors
+        gdf_fc['color2'] = colors[-1]
+            
+        # Create an individual map
+        map_one = self.create_map_template(title=map_title,
+                                    Xcenter=Xcenter,Ycenter=Ycenter)
+        
+        # Add the AOI and buffered areas to individual maps
+        aoi_grps_o= self.add_aoi_layers(map_one)
+
+        # Zoom the map to the layer extent
+        gdf_fc = to_wgs84(gdf_fc)
+        xmin, ymin, xmax, ymax = gdf_fc['geometry'].total_bounds
+        map_one.fit_bounds([[ymin, xmin], [ymax, xmax]])
+        
+        # Create a list of columns for the tooltip
+        gdf_fc['map_title'] = map_title
+        tooltip_cols = ['map_title',label_col]
+
+        # Serialize the layer once, for the individual and all-layers maps
+        # (the all-layers map only needs the serialized layer, its sidecar or tiles, not the gdf)
+        result = {'map_title': map_title,
+                  'data_key': fc,
+                  'fields': [col for col in gdf_fc.columns if col != 'geometry'],
+                  'geojson': None,
+                  'tiles': None,
+                  'label_col': label_col,
+                  'tooltip_cols': tooltip_cols,
+                  'popup_cols': popup_cols}
+
+        tiled = self.tile_threshold is not None and gdf_fc.shape[0] > self.tile_threshold
+        if tiled:
+            print (f"..writing {fc} as vector tiles ({gdf_fc.shape[0]} features): open its maps through a web server")
+            result['tiles'] = write_vector_tiles(gdf_fc, self.out_loc, fc)
+        elif self.compact:
+            write_sidecar(self.out_loc, fc, {fc: self.layer_geojson(gdf_fc)})
+            add_sidecar(map_one, fc)
+        else:
+            result['geojson'] = self.layer_geojson(gdf_fc)
+
+        # Add the layer to the individual map
+        grp_fc_o= folium.FeatureGroup(name= map_title, show= True)  
+        lyr_fc_o= self.overlap_layer(result, 'color', name=map_title)
+        lyr_fc_o.add_to(grp_fc_o)
+        grp_fc_o.add_to(map_one)
+
+        # Create a Legend for individual maps
+        #legend colors and names
+        legend_labels = zip(gdf_fc['color'], gdf_fc[label_col])
+        if tiled:
+            legend_labels = list(legend_labels)[:LEGEND_MAX_ITEMS]
+        
+        #start the div tag and set the legend size and position
+        legend_html = '''
+                    <div id="legend" style="position: fixed; 
+                    bottom: 200px; right: 30px; z-index: 1000; 
+                    background-color: #fff; padding: 10px; 
+                    border-radius: 5px; border: 1px solid grey;">
+                    '''
+                    
+        #add the AOI item to the legend
+        legend_html += '''
+                    <div style="display: inline-block; 
+                    margin-right: 10px;
+                    background-color: transparent;
+                    border: 2px solid red;
+                    width: 15px; height: 15px;"></div>AOI<br>
+                    '''
+                    
+        #add the AOI buffer item to the legend
+        legend_html += '''
+                    <div style="display: inline-block; 
+                    margin-right: 10px;background-color: transparent; 
+                    border: 2px solid orange;
+                    width: 15px; height: 15px;"></div>AOI buffers<br>
+                    '''            
+        
+        #add a header to the legend            
+        legend_html += '''
+                    <div style="font-weight: bold; 
+                    margin-bottom: 5px;">{}</div>
+                    '''.format(label_col)
+    
+        #add items to the legend
+        for color, name in legend_labels:
+            legend_html += '''
+                            <div style="display: inline-block; 
+                            margin-right: 10px;background-color: {0}; 
+                            width: 15px; height: 15px;"></div>{1}<br>
+                            '''.format(color, name)
+        if tiled and gdf_fc.shape[0] > LEGEND_MAX_ITEMS:
+            legend_html += '... {} more<br>'.format(gdf_fc.shape[0] - LEGEND_MAX_ITEMS)
+        #close the div tag
+        legend_html += '</div>'
+
+        #add the legend to the individual maps
+        map_one.get_root().html.add_child(folium.Element(legend_html))
+
+        # Add layer controls to the individual map
+        lyr_cont_one = folium.LayerControl()
+        lyr_cont_one.add_to(map_one)
+
+        #Add goups to the layer controls of the individual maps
+        GroupedLayerControl(
+        groups={
+        "AREA OF INTEREST": aoi_grps_o,
+        "LAYER": [grp_fc_o]
+            },
+        exclusive_groups=False,
+        collapsed=True
+            ).add_to(map_one)
+    
+        # Save the indivdiual map to html file
+        map_one.save(os.path.join(self.out_loc, fc+'.html'))
+
+        return result
+
+
+    def render_layer_maps(self, tasks):
+        """
+        Renders the individual maps of (spec, fc) tasks. Returns their results, in task order.
+
+        With max_workers > 1 the maps are rendered in a process pool (folium serialization is
+        CPU bound). The generator, holding the serialized AOI and buffer layers, is sent once
+        to each worker by the pool initializer instead of once per task.
+        """
+        if self.max_workers <= 1 or len(tasks) <= 1:
+            results = []
+            for i, (spec, fc) in enumerate(tasks):
+                print (f"..creating Map {i + 1} of {len(tasks)}: {fc}")
+                results.append(self.render_layer_map(spec, fc))
+            return results
+
+        print (f"..rendering {len(tasks)} maps ({self.max_workers} processes)")
+        with ProcessPoolExecutor(max_workers=self.max_workers,
+                                 initializer=init_render_worker, initargs=(self,)) as executor:
+            results = list(executor.map(render_layer_task, tasks))
+
+        return results
+
+
+    def generate_html_maps(self):
+        """Creates a HTML map for each feature class in gdb"""
+
+        print('\nReading input xlsxs')
+        df_st, specs= self.get_catalogue()
+        
+        print ('\nPreparing Layers for mapping')
+        self.prepare_aoi_layers()
+        Xcenter, Ycenter = self.center
+        
+        print ('\nCreating a map template')
+        # Create an all-layers map
+        map_all = self.create_map_template(title='Overview Map - All Overlaps',
+                                    Xcenter=Xcenter,Ycenter=Ycenter)
+             
+        # Add the AOI layer and buffered areas to the all-layers map
+        aoi_grps= self.add_aoi_layers(map_all)
         
         # Zoom the all-layers map to the AOI extent
-        xmin,ymin,xmax,ymax = bf_gdfs.get('aoi_1000').to_crs(4326)['geometry'].total_bounds
+        xmin,ymin,xmax,ymax = self.aoi_bounds
         map_all.fit_bounds([[ymin, xmin], [ymax, xmax]])
         
         
@@ -178,237 +704,69 @@ class HTMLGenerator:
         
         ctg_grps=[aoi_grps]
 
-        fc_list= fiona.listlayers(self.status_gdb)
+        fc_list= list(pyogrio.list_layers(self.status_gdb)[:, 0])
+
+        # one task per feature class to map, in category order. A feature class listed in both
+        # workbooks is mapped once (parallel renders would write the same files), with its first spec
+        first_specs= {}
+        for spec in specs:
+            fc= spec.name.replace(" ", "_") if spec.name else None
+            first_specs.setdefault(fc, spec)
+
+        tasks= []
+        task_ctgs= []
+        for ctg in ctg_list:
+            for spec in specs:
+                fc= spec.name.replace(" ", "_") if spec.name else None
+                if spec.category == ctg and fc in fc_list and fc in first_specs:
+                    tasks.append((first_specs.pop(fc), fc))
+                    task_ctgs.append(ctg)
+
+        results= self.render_layer_maps(tasks)
         
         for ctg in ctg_list:
-            print (f'\nGenerating Maps for {ctg}')
-            
-            df= df_st.loc[df_st['Category'] == ctg]
+            print (f'\nAdding {ctg} layers to the all-layers map')
             fc_grps= []
-            counter= 1
-            for i, row in df.iterrows():  
-                fc= row['Featureclass_Name(valid characters only)']
-                fc= fc.replace(" ", "_")
-        
-                print (f"..creating Map {counter} of {len(df)}: {fc}")
-                if fc in fc_list:
-                    gdf_fc = gpd.read_file(filename= self.status_gdb, layer= fc)
-            
-                    if gdf_fc.shape[0] > 0:
-                        #Flatten 3D geometries to 2D (Folium doesn't like 3D)    
-                        if gdf_fc['geometry'].has_z.any():
-                            gdf_fc['geometry'] = gdf_fc['geometry'].apply(
-                                        lambda geom: wkt.loads(
-                                            wkt.dumps(geom, output_dimension=2)))
-                            
-                        #convert all cols to str except geometry
-                        for col in gdf_fc.columns:
-                            if col != 'geometry':
-                                gdf_fc[col] = gdf_fc[col].astype(str)
-                            
-                        # Set label column. Will be used for tooltip and legend.
-                        map_title = fc.replace('_', ' ')
-            
-                        df_item= df_st.loc[df_st['Featureclass_Name(valid characters only)'] == map_title]
-                        label_col= df_item['map_label_field'].iloc[0]
-            
-                        if pd.isnull(label_col):
-                            label_col= df_item['Fields_to_Summarize'].iloc[0]
-                        
-                        if pd.isnull(label_col):
-                            label_col = gdf_fc.columns[0]
-                            
-                        # Set pop up columns
-                        popup_cols = []
-                        
-                        first_field = df_item['Fields_to_Summarize'].iloc[0]
-                        if pd.notnull(first_field):
-                            popup_cols.append(str(first_field.strip()))
-                            
-                        for f in range (2,7):
-                            for i in df_item['Fields_to_Summarize' + str(f)].tolist():
-                                if pd.notnull(i):
-                                    popup_cols.append(str(i.strip()))
-            
-                        if len(popup_cols) == 0:
-                            popup_cols = [col for col in gdf_fc.columns if col != 'geometry'] 
-                        
-                        # Format the popup columns for better visulization
-                        for col in popup_cols:
-                            gdf_fc[col] = gdf_fc[col].astype(str)
-                            gdf_fc[col] = gdf_fc[col].str.wrap(width=20).str.replace('\n','<br>')
-                        
-                        
-                        # Assign random colors to the features (for legend)
-                        for x in gdf_fc.index:
-                            color = np.random.randint(16, 256, size=3)
-                            color = [str(hex(i))[2:] for i in color]
-                            color = '#'+''.join(color).upper()
-                            gdf_fc.at[x, 'color'] = color
-                        
-                        gdf_fc['color2']=color
-                            
-                        # Create an individual map
-                        map_one = self.create_map_template(title=map_title,
-                                                    Xcenter=Xcenter,Ycenter=Ycenter)
-                        
-                        # Add the AOI layer to individual maps
-                        grp_aoi_o= folium.FeatureGroup(name= 'AOI')  
-                        lyr_aoi_o= folium.GeoJson(data=gdf_aoi, name='AOI',
-                                    style_function=lambda x:{'color': 'red', 
-                                                                'fillColor': 'none',
-                                                                'weight': 3})
-                        lyr_aoi_o.add_to(grp_aoi_o)
-                        grp_aoi_o.add_to(map_one)
-            
-                        aoi_grps_o= [grp_aoi_o]
-            
-                        # Add buffered areas to ndividual maps
-                        for k,v in bf_gdfs.items():
-                            grp_aoi_b_o= folium.FeatureGroup(name= k.upper()+' m')  
-                            lyr_aoi_b_o= folium.GeoJson(data=v, name=k, show=True,
-                                            style_function=lambda x:{'color': 'orange',
-                                                                    'fillColor': 'none',
-                                                                    'weight': 3})
-                            lyr_aoi_b_o.add_to(grp_aoi_b_o)
-                            grp_aoi_b_o.add_to(map_one)
-            
-                            aoi_grps_o.append(grp_aoi_b_o)
-            
-                        # Zoom the map to the layer extent
-                        gdf_fc = gdf_fc.to_crs(4326)
-                        xmin, ymin, xmax, ymax = gdf_fc['geometry'].total_bounds
-                        map_one.fit_bounds([[ymin, xmin], [ymax, xmax]])
-                        
-                        # Create a list of columns for the tooltip
-                        gdf_fc['map_title'] = map_title
-                        tooltip_cols = ['map_title',label_col]
-            
-                        # Add the layer to the individual map
-                        grp_fc_o= folium.FeatureGroup(name= map_title, show= True)  
-                        lyr_fc_o= folium.GeoJson(data=gdf_fc, name=map_title,
-                                    marker=folium.Circle(radius=5),
-                                    style_function= lambda x: {'fillColor': x['properties']['color'],
-                                                                'color': x['properties']['color'],
-                                                                'weight': 2},
-                                    tooltip=folium.features.GeoJsonTooltip(fields=tooltip_cols,
-                                                                            aliases=['LAYER', label_col],
-                                                                            labels=True),
-                                    popup=folium.features.GeoJsonPopup(fields=popup_cols, 
-                                                                        sticky=False,
-                                                                        max_width=380))
-                        lyr_fc_o.add_to(grp_fc_o)
-                        grp_fc_o.add_to(map_one)
-            
-                        # Add the layer to the all-Layers map
-                        grp_fc_a= folium.FeatureGroup(name= map_title, show= False)  
-                        lyr_fc_a= folium.GeoJson(data=gdf_fc, name=map_title,
-                                    marker=folium.Circle(radius=5),
-                                    style_function= lambda x: {'fillColor': x['properties']['color2'],
-                                                                'color': x['properties']['color2'],
-                                                                'weight': 2},
-                                    tooltip=folium.features.GeoJsonTooltip(fields=tooltip_cols,
-                                                                            aliases=['LAYER', label_col],
-                                                                            labels=True),
-                                    popup=folium.features.GeoJsonPopup(fields=popup_cols, 
-                                                                        sticky=False,
-                                                                        max_width=380))
-                        lyr_fc_a.add_to(grp_fc_a)
-                        grp_fc_a.add_to(map_all)
-                        
-                        fc_grps.append(grp_fc_a)
-            
-                        # Create a Legend for individual maps
-                        #legend colors and names
-                        legend_labels = zip(gdf_fc['color'], gdf_fc[label_col])
-                        
-                        #start the div tag and set the legend size and position
-                        legend_html = '''
-                                    <div id="legend" style="position: fixed; 
-                                    bottom: 200px; right: 30px; z-index: 1000; 
-                                    background-color: #fff; padding: 10px; 
-                                    border-radius: 5px; border: 1px solid grey;">
-                                    '''
-                                    
-                        #add the AOI item to the legend
-                        legend_html += '''
-                                    <div style="display: inline-block; 
-                                    margin-right: 10px;
-                                    background-color: transparent;
-                                    border: 2px solid red;
-                                    width: 15px; height: 15px;"></div>AOI<br>
-                                    '''
-                                    
-                        #add the AOI buffer item to the legend
-                        legend_html += '''
-                                    <div style="display: inline-block; 
-                                    margin-right: 10px;background-color: transparent; 
-                                    border: 2px solid orange;
-                                    width: 15px; height: 15px;"></div>AOI buffers<br>
-                                    '''            
-                        
-                        #add a header to the legend            
-                        legend_html += '''
-                                    <div style="font-weight: bold; 
-                                    margin-bottom: 5px;">{}</div>
-                                    '''.format(label_col)
-                    
-                        #add items to the legend
-                        for color, name in legend_labels:
-                            legend_html += '''
-                                            <div style="display: inline-block; 
-                                            margin-right: 10px;background-color: {0}; 
-                                            width: 15px; height: 15px;"></div>{1}<br>
-                                            '''.format(color, name)
-                        #close the div tag
-                        legend_html += '</div>'
-            
-                        #add the legend to the individual maps
-                        map_one.get_root().html.add_child(folium.Element(legend_html))
-            
-                        # Add layer controls to the individual map
-                        lyr_cont_one = folium.LayerControl()
-                        lyr_cont_one.add_to(map_one)
-            
-                        #Add goups to the layer controls of the individual maps
-                        GroupedLayerControl(
-                        groups={
-                        "AREA OF INTEREST": aoi_grps_o,
-                        "LAYER": [grp_fc_o]
-                            },
-                        exclusive_groups=False,
-                        collapsed=True
-                            ).add_to(map_one)
-                    
-                        # Save the indivdiual map to html file
-                        map_one.save(os.path.join(self.out_loc, fc+'.html'))
-        
-            
-                counter += 1
-        
-                # Create a Legend for all-layers map
-                legend_html_all = '''
-                        <div id="legend" style="position: fixed; 
-                        bottom: 200px; right: 30px; z-index: 1000; 
-                        background-color: #fff; padding: 10px; 
-                        border-radius: 5px; border: 1px solid grey;">
-        
-                        <div style="display: inline-block; 
-                        margin-right: 10px;
-                        background-color: transparent;
-                        border: 2px solid red;
-                        width: 15px; height: 15px;"></div>AOI<br>
-                        
-                        <div style="display: inline-block; 
-                        margin-right: 10px;background-color: transparent; 
-                        border: 2px solid orange;
-                        width: 15px; height: 15px;"></div>AOI buffers<br>
-                        
-                        </div>
-                        '''  
+            for task_ctg, result in zip(task_ctgs, results):
+                if task_ctg != ctg or result is None:
+                    continue
+
+                map_title = result['map_title']
+
+                # Add the layer to the all-Layers map (compact: the sidecar of the individual map,
+                # tiled: the tiles of the individual map)
+                if self.compact and not result['tiles']:
+                    add_sidecar(map_all, result['data_key'])
+                grp_fc_a= folium.FeatureGroup(name= map_title, show= False)  
+                lyr_fc_a= self.overlap_layer(result, 'color2', name=map_title)
+                lyr_fc_a.add_to(grp_fc_a)
+                grp_fc_a.add_to(map_all)
+                
+                fc_grps.append(grp_fc_a)
         
             if len(fc_grps) > 0:            
                 ctg_grps.append(fc_grps) 
+
+        # Create a Legend for all-layers map
+        legend_html_all = '''
+                <div id="legend" style="position: fixed; 
+                bottom: 200px; right: 30px; z-index: 1000; 
+                background-color: #fff; padding: 10px; 
+                border-radius: 5px; border: 1px solid grey;">
+
+                <div style="display: inline-block; 
+                margin-right: 10px;
+                background-color: transparent;
+                border: 2px solid red;
+                width: 15px; height: 15px;"></div>AOI<br>
+                
+                <div style="display: inline-block; 
+                margin-right: 10px;background-color: transparent; 
+                border: 2px solid orange;
+                width: 15px; height: 15px;"></div>AOI buffers<br>
+                
+                </div>
+                '''  
         
         #add the legend to the all-layers map
         map_all.get_root().html.add_child(folium.Element(legend_html_all))   
@@ -430,6 +788,21 @@ class HTMLGenerator:
         # Save the all-layers map to html file
         print('\nGenerating the all-layers map')
         map_all.save(os.path.join(self.out_loc, '00_all_layers.html'))
+
+
+
+# Generator of the render worker processes (set once per process by the pool initializer)
+_render_generator = None
+
+
+def init_render_worker(generator):
+    global _render_generator
+    _render_generator = generator
+
+
+def render_layer_task(task):
+    spec, fc = task
+    return _render_generator.render_layer_map(spec, fc)
         
 
 
@@ -442,7 +815,7 @@ if __name__ == "__main__":
     common_xls= r'path\to\statusing_input_spreadsheets\one_status_common_datasets.xlsx'
     region_xls= r'path\to\statusing_input_spreadsheets\one_status_west_coast_specific.xlsx'
 
-    html = HTMLGenerator(common_xls, region_xls, work_gdb, map_directory)
+    html = HTMLGenerator(common_xls, region_xls, work_gdb, map_directory, max_workers=os.cpu_count())
     html.generate_html_maps()
 
     finish_t = timeit.default_timer() #finish time
@@ -0,0 +1,95 @@
+'''
+Local cache of the inactive dispositions rows, keyed by parcel (INTRID_SID).
+
+Overlapping AOIs of a batch share many parcels. Each parcel queried for
+inactive dispositions is recorded with its query time, along with the rows
+returned (none for most parcels), so the parcels queried within the
+freshness window are not fetched again.
+'''
+import os
+import sys
+import time
+import pickle
+import threading
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+# Use main scripts dir for the project path
+current_script_path = Path(__file__).resolve().parents[1]
+sys.path.append(str(current_script_path))
+
+from modules.cache_utils import cache_path
+
+
+DEFAULT_MAX_AGE_HOURS = 24
+
+
+class InactiveRowCache:
+    def __init__(self, cache_file=None, max_age_hours=DEFAULT_MAX_AGE_HOURS):
+        """
+        Initialize the InactiveRowCache and load the cache file (if any).
+
+        Args:
+            cache_file (str): Path of the pickle cache file.
+            max_age_hours (float): Freshness window of a queried parcel.
+        """
+        self.cache_file = cache_file or cache_path('inactive_rows.pkl')
+        self.max_age = max_age_hours * 3600
+        self._lock = threading.Lock()
+
+        self.queried = {}   # INTRID_SID -> time of the query
+        self.rows = None    # df of the rows returned for the queried parcels
+        try:
+            with open(self.cache_file, 'rb') as f:
+                self.queried, self.rows = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            pass
+
+
+    def split(self, parcel_list):
+        """
+        Returns the cached rows of the fresh parcels of a list, and the parcels to query.
+
+        Returns:
+            tuple: (df of cached rows or None, list of INTRID_SID not cached or expired)
+        """
+        oldest = time.time() - self.max_age
+        parcels = list(dict.fromkeys(int(x) for x in parcel_list))
+        with self._lock:
+            fresh = np.array([self.queried.get(p, 0) >= oldest for p in parcels], dtype=bool)
+            rows = self.rows
+
+        fresh_ids = np.array(parcels, dtype=np.int64)[fresh] if parcels else np.array([], dtype=np.int64)
+        missing = [p for p, f in zip(parcels, fresh) if not f]
+        if rows is not None:
+            rows = rows[rows['INTRID_SID'].isin(fresh_ids)]
+
+        return rows, missing
+
+
+    def put(self, parcel_ids, df):
+        """Records the rows returned by the query of a list of parcels (replacing older rows)"""
+        now = time.time()
+        parcel_ids = [int(x) for x in parcel_ids]
+        with self._lock:
+            oldest = now - self.max_age
+            self.queried = {p: t for p, t in self.queried.items() if t >= oldest}
+            self.queried.update(dict.fromkeys(parcel_ids, now))
+
+            kept = self.rows
+            if kept is not None:
+                kept = kept[kept['INTRID_SID'].isin(list(self.queried))
+                            & ~kept['INTRID_SID'].isin(parcel_ids)]
+            parts = [x for x in (kept, df) if x is not None and len(x)]
+            self.rows = pd.concat(parts, ignore_index=True) if parts else df
+
+
+    def save(self):
+        """Writes the cache to disk atomically"""
+        with self._lock:
+            data = (dict(self.queried), self.rows)
+        tmp = self.cache_file + f'.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.cache_file)
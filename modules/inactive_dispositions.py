@@ -1,15 +1,36 @@
-import os
 import pyodbc
+import oracledb
+import numpy as np
 import pandas as pd
-import arcpy
+import geopandas as gpd
 import sys
+import threading
 from pathlib import Path
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
 from tantalis_bigQuery import load_sql
 
 # Use main scripts dir for the project path
 current_script_path = Path(__file__).resolve().parents[1]
 sys.path.append(str(current_script_path))
 
+import config
+from modules.aoi_prep import prepare_aoi, PROJECTED_CRS
+from modules.local_overlay import LocalOverlayEngine
+from modules.layer_snapshot import split_datasource
+from modules.query_fetch import DEFAULT_ARRAYSIZE
+
+
+PARCEL_BIND_MODES = ('collection', 'temp_table', 'chunks')
+CHUNK_SIZE = 1000                     # Oracle IN-list limit
+COLLECTION_TYPE = 'SYS.ODCINUMBERLIST'
+COLLECTION_LIMIT = 32767              # max size of a SYS.ODCINUMBERLIST varray
+PARCEL_TABLE = 'AST_PARCEL_IDS'
+DEFAULT_MAX_WORKERS = 4
+
+_parcel_table_checked = False
+_parcel_table_lock = threading.Lock()
+
 
 def connect_to_DB (driver,server,port,dbq, username,password):
     """ Returns a connection to Oracle database"""
@@ -31,11 +52,15 @@ def connect_to_DB (driver,server,port,dbq, username,password):
     return connection
 
 
-def read_query(connection,query):
-    "Returns a df containing SQL Query results"
+def read_query(connection,query,bvars=None):
+    """Returns a df containing SQL Query results.
+       The connection is left open so pooled sessions can be reused by the caller."""
     cursor = connection.cursor()
     try:
-        cursor.execute(query)
+        if bvars:
+            cursor.execute(query, bvars)
+        else:
+            cursor.execute(query)
         cols = [x[0] for x in cursor.description]
         rows = cursor.fetchall()
         return pd.DataFrame.from_records(rows, columns=cols)
@@ -43,7 +68,6 @@ def read_query(connection,query):
     finally:
         if cursor is not None:
             cursor.close()
-            connection.close()
 
 
 def format_parcels_list(parcel_list):
@@ -74,39 +98,170 @@ def format_parcels_list(parcel_list):
     return parcels_q_str 
 
 
+def parcel_chunks(parcel_list, size):
+    """Returns the distinct parcel ids split into chunks of size items"""
+    parcels = list(dict.fromkeys(int(x) for x in parcel_list))
+
+    return [parcels[i:i + size] for i in range(0, len(parcels), size)]
+
+
+def padded_in_clause(chunk, size=CHUNK_SIZE, style='named'):
+    """
+    Returns an IN clause of size bind variables and its values, padded with NULLs
+    (which match nothing), so every chunk of a run shares the same SQL text.
+
+    Args:
+        style (str): 'named' (:p0, :p1 ... for oracledb) or 'qmark' (? for pyodbc).
+    """
+    values = list(chunk) + [None] * (size - len(chunk))
+    if style == 'qmark':
+        return 'IP.INTRID_SID IN (' + ','.join('?' * size) + ')', values
+
+    names = [f'p{i}' for i in range(size)]
+    return 'IP.INTRID_SID IN (' + ','.join(':' + n for n in names) + ')', dict(zip(names, values))
+
+
+def sort_inactive(df):
+    """Restores the query order (most recent status first) of results merged from several executions"""
+    return df.sort_values('EFFECTIVE_DAT', ascending=False, kind='stable').reset_index(drop=True)
+
+
+def query_parcels_collection(connection, template, parcel_list):
+    """Runs the inactive lands query with the parcel ids bound as SYS.ODCINUMBERLIST collections
+       (one execution per 32767 parcels, always the same SQL text)"""
+    prcl = ("IP.INTRID_SID IN (SELECT /*+ CARDINALITY(p 1000) */ p.COLUMN_VALUE "
+            "FROM TABLE(:parcel_ids) p)")
+    query = template.format(prcl=prcl)
+    list_type = connection.gettype(COLLECTION_TYPE)
+
+    dfs = [read_query(connection, query, {'parcel_ids': list_type.newobject(chunk)})
+           for chunk in parcel_chunks(parcel_list, COLLECTION_LIMIT) or [[]]]
+
+    return sort_inactive(pd.concat(dfs, ignore_index=True)) if len(dfs) > 1 else dfs[0]
+
+
+def ensure_parcel_table(connection):
+    """Creates the session temporary table of the parcel ids if it does not exist (once per process)"""
+    global _parcel_table_checked
+    with _parcel_table_lock:
+        if _parcel_table_checked:
+            return
+        cursor = connection.cursor()
+        try:
+            cursor.execute("SELECT COUNT(*) FROM USER_TABLES WHERE TABLE_NAME = :tab", {'tab': PARCEL_TABLE})
+            if cursor.fetchone()[0] == 0:
+                print(f'Creating the parcel ids table {PARCEL_TABLE}.')
+                cursor.execute(f"""CREATE GLOBAL TEMPORARY TABLE {PARCEL_TABLE} (
+                                       INTRID_SID NUMBER PRIMARY KEY)
+                                   ON COMMIT DELETE ROWS""")
+        finally:
+            cursor.close()
+        _parcel_table_checked = True
+
+
+def query_parcels_temp_table(connection, template, parcel_list):
+    """Runs the inactive lands query joined to a temporary table loaded with the parcel ids"""
+    ensure_parcel_table(connection)
+    query = template.format(prcl=f"IP.INTRID_SID IN (SELECT t.INTRID_SID FROM {PARCEL_TABLE} t)")
+
+    cursor = connection.cursor()
+    try:
+        for chunk in parcel_chunks(parcel_list, 50000):
+            cursor.executemany(f"INSERT INTO {PARCEL_TABLE} (INTRID_SID) VALUES (:1)", [(x,) for x in chunk])
+        return read_query(connection, query)
+    finally:
+        cursor.close()
+        connection.rollback()   # empties the table (rows are private to this transaction)
+
+
+def query_parcels_chunks(session, template, parcel_list, max_workers=DEFAULT_MAX_WORKERS, style='named'):
+    """
+    Runs the inactive lands query once per chunk of 1000 parcel ids, in parallel.
+
+    Args:
+        session (callable): Context manager factory yielding a connection (e.g. SessionPool.acquire).
+        style (str): Bind style of the driver ('named' or 'qmark').
+    """
+    prcl = padded_in_clause([], style=style)[0]
+    query = template.format(prcl=prcl)
+
+    def run(chunk):
+        with session() as connection:
+            return read_query(connection, query, padded_in_clause(chunk, style=style)[1])
+
+    chunks = parcel_chunks(parcel_list, CHUNK_SIZE) or [[]]
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks)))) as executor:
+        dfs = list(executor.map(run, chunks))
+
+    return sort_inactive(pd.concat(dfs, ignore_index=True)) if len(dfs) > 1 else dfs[0]
+
+
+def query_inactive_lands(pool, parcel_list, bind_mode='collection', max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Returns a df of the inactive Lands dispositions of a parcel list of any size.
+    The parcel ids are always bind variables: the SQL text does not depend on the list.
+
+    Args:
+        pool (SessionPool): Session pool.
+        parcel_list (list): INTRID_SID values.
+        bind_mode (str): 'collection' (SYS.ODCINUMBERLIST bind), 'temp_table' (temporary table join)
+                         or 'chunks' (padded 1000-id IN lists run in parallel). If a mode fails
+                         (e.g. missing privileges), the next one is used.
+    """
+    template = load_sql()['inactive_lands']
+    modes = PARCEL_BIND_MODES[PARCEL_BIND_MODES.index(bind_mode):]
+
+    for mode in modes:
+        try:
+            if mode == 'chunks':
+                return query_parcels_chunks(pool.acquire, template, parcel_list, max_workers)
+            with pool.acquire() as connection:
+                if mode == 'collection':
+                    return query_parcels_collection(connection, template, parcel_list)
+                return query_parcels_temp_table(connection, template, parcel_list)
+        except Exception as e:
+            if mode == modes[-1]:
+                raise
+            print(f'Parcel binding mode {mode} failed ({e}), trying {modes[modes.index(mode) + 1]}.')
+
+
 def get_inact_info(df_inact_lands):
-    """Harmonizes column names of inactive dfs as per ILRR schema and returns values Lists.
+    """Harmonizes column names of inactive dfs as per ILRR schema and returns values arrays (one per column).
        Only Inactive Lands df is provided for now. Add others as required."""  
-    
-    df_inact_lands['HOLDER_NAME'] = df_inact_lands['HOLDER_ORGANNSATION_NAME'].fillna('')\
-                                    + df_inact_lands['HOLDER_INDIVIDUAL_NAME'].fillna('')
+
+    holder = df_inact_lands['HOLDER_ORGANNSATION_NAME'].fillna('')\
+             + df_inact_lands['HOLDER_INDIVIDUAL_NAME'].fillna('')
+    df = pd.DataFrame({'INTRID_SID': df_inact_lands['INTRID_SID'],
+                       'DISPOSITION_TRANSACTION_SID': df_inact_lands['DISPOSITION_TRANSACTION_SID'],
+                       'FILE_CHR': df_inact_lands['FILE_CHR'],
+                       'interest_type': df_inact_lands['PURPOSE_NME'] + ' ' + df_inact_lands['TYPE_NME'],
+                       'HOLDER_NAME': holder})
 
     # delete duplicates: same dispID and same Holder name.
-    df_inact_lands.drop_duplicates(subset = ['DISPOSITION_TRANSACTION_SID', 'HOLDER_NAME'], inplace=True)
-    df_inact_lands.drop(['HOLDER_ORGANNSATION_NAME', 'HOLDER_INDIVIDUAL_NAME'], inplace=True, axis=1)
-    
-    # Merge same dispID with multiple Holders into the same row
-    gr_cols = [col for col in df_inact_lands.columns]
-    gr_cols.remove('HOLDER_NAME')
-    df_inact_lands = df_inact_lands.groupby(gr_cols)['HOLDER_NAME'].apply(' / '.join).reset_index()
-    
-    # transform to ILLR col names and schema
-    df_inact_lands['interest_status'] = 'INACTIVE'
-    df_inact_lands['interest_type'] = df_inact_lands['PURPOSE_NME'] + ' ' + df_inact_lands['TYPE_NME']
-    df_inact_lands['dpr_registry_name'] = 'CROWN LANDS'
-    df_inact_lands['business_identifier'] = 'Disp Trans SID: ' + df_inact_lands['DISPOSITION_TRANSACTION_SID'].astype(int).astype(str)\
-                                    + ' ' + 'FILE NUMBER: ' +  df_inact_lands['FILE_CHR']
-    df_inact_lands['responsible_agency'] = 'FLNR'
-    df_inact_lands['summary_holders_ilrr_identifier'] = df_inact_lands['HOLDER_NAME']
-    
-    #Create lists of values
+    df = df.drop_duplicates(subset=['DISPOSITION_TRANSACTION_SID', 'HOLDER_NAME'])
+
+    # Merge same dispID with multiple Holders into the same row (the other columns depend on the keys):
+    # sort by keys, then join the holders of each run of equal keys with one reduceat
+    keys = ['INTRID_SID', 'DISPOSITION_TRANSACTION_SID']
+    df = df.sort_values(keys, kind='stable', ignore_index=True)
+    if len(df):
+        starts = np.flatnonzero((df[keys].shift() != df[keys]).any(axis=1).to_numpy())
+        separators = np.full(len(df), ' / ', dtype=object)
+        separators[starts] = ''
+        holders = np.add.reduceat(separators + df['HOLDER_NAME'].to_numpy(dtype=object), starts)
+        df = df.iloc[starts].reset_index(drop=True)
+        df['HOLDER_NAME'] = holders
+
+    # ILRR schema, as columns
+    n = len(df)
     ilrr_info = {}
-    ilrr_info['interest_status'] = df_inact_lands['interest_status'].tolist()
-    ilrr_info['interest_type']  = df_inact_lands['interest_type'].tolist()
-    ilrr_info['dpr_registry_name']  = df_inact_lands['dpr_registry_name'].tolist()
-    ilrr_info['business_identifier']  = df_inact_lands['business_identifier'].tolist()
-    ilrr_info['responsible_agency']  = df_inact_lands['responsible_agency'].tolist()
-    ilrr_info['summary_holders_ilrr_identifier']  = df_inact_lands['summary_holders_ilrr_identifier'].tolist()
+    ilrr_info['interest_status'] = np.full(n, 'INACTIVE', dtype=object)
+    ilrr_info['interest_type'] = df['interest_type'].to_numpy(dtype=object)
+    ilrr_info['dpr_registry_name'] = np.full(n, 'CROWN LANDS', dtype=object)
+    ilrr_info['business_identifier'] = ('Disp Trans SID: ' + df['DISPOSITION_TRANSACTION_SID'].astype(int).astype(str)
+                                        + ' ' + 'FILE NUMBER: ' + df['FILE_CHR']).to_numpy(dtype=object)
+    ilrr_info['responsible_agency'] = np.full(n, 'FLNR', dtype=object)
+    ilrr_info['summary_holders_ilrr_identifier'] = df['HOLDER_NAME'].to_numpy(dtype=object)
     
     return ilrr_info
 
@@ -118,31 +273,100 @@ def get_oracle_driver():
         latest_driver = max(oracle_drivers)
         return latest_driver
     else:
-        arcpy.AddWarning("TAB2 could not be generated. Oracle drivers do not exist on the GTS. Please contact geospatialservices.waterland@gov.bc.ca for support")
+        print("WARNING: TAB2 could not be generated. Oracle drivers do not exist on the GTS. Please contact geospatialservices.waterland@gov.bc.ca for support")
         return
 
 
-def execute_process(parcel_list,bcgw_user,bcgw_pwd,oracle_driv):
-    """Generates a csv of inactive Lands dispositions"""
-    
-    print('Connecting to BCGW.')
-    driver = oracle_driv #'Oracle in OraClient12Home2'
-    server = config.CONNSERVER
-    port = config.CONNPORT
-    dbq = config.CONNDBQ
-    hostname = config.CONNINSTANCE
-
-    connection = connect_to_DB(driver,server,port,dbq,bcgw_user,bcgw_pwd)
+def discover_parcels_query(pool, prepared_aoi):
+    """Returns the INTRID_SIDs of the Tantalis parcels intersecting the AOI (one spatial query)"""
+    query = load_sql()['parcels_aoi']
+    with pool.acquire() as connection:
+        cursor = connection.cursor()
+        try:
+            cursor.arraysize = DEFAULT_ARRAYSIZE
+            cursor.setinputsizes(wkb_aoi=oracledb.DB_TYPE_BLOB)
+            cursor.execute(query, wkb_aoi=prepared_aoi.wkb, srid_aoi=prepared_aoi.srid)
+            return [int(row[0]) for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+
+
+def discover_parcels_local(parcel_source, prepared_aoi):
+    """Returns the INTRID_SIDs of the parcels of a local copy of TA_INTEREST_PARCEL_SHAPES
+       intersecting the AOI (snapshot read + STRtree, see LocalOverlayEngine)"""
+    engine = LocalOverlayEngine(prepared_aoi.geometry, prepared_aoi.crs, filter_geom=prepared_aoi.simplified)
+    parcels = engine.overlay(parcel_source, radius=0, columns=['INTRID_SID'])
+
+    return parcels['INTRID_SID'].astype('int64').tolist()
+
+
+def discover_parcels(aoi, pool=None, parcel_source=None):
+    """
+    Returns the distinct INTRID_SIDs of the Tantalis interest parcels intersecting an AOI.
+
+    Args:
+        aoi (gpd.GeoDataFrame): AOI features.
+        pool (SessionPool): Session pool, for the spatial query on TA_INTEREST_PARCEL_SHAPES.
+        parcel_source (str): Local copy of the parcels (shp, <gdb>/<feature class>, gpkg) with an
+                             INTRID_SID field. If given, the parcels are found locally instead.
+    """
+    prepared = prepare_aoi(aoi)
+    if parcel_source:
+        parcel_list = discover_parcels_local(parcel_source, prepared)
+    elif pool is not None:
+        if prepared.srid is None:
+            # the AOI SRID is bound in the spatial query: use BC Albers for CRS without an EPSG code
+            if aoi.crs is None:
+                raise ValueError('The AOI has no CRS: its parcels cannot be queried in BCGW')
+            prepared = prepare_aoi(aoi.to_crs(PROJECTED_CRS))
+        parcel_list = discover_parcels_query(pool, prepared)
+    else:
+        raise ValueError('A session pool or a local parcels datasource is required')
+
+    return list(dict.fromkeys(parcel_list))
+
+
+def execute_process(parcel_list,bcgw_user,bcgw_pwd,oracle_driv,pool=None,bind_mode='collection',row_cache=None):
+    """Generates a csv of inactive Lands dispositions.
+       If a SessionPool is provided, the query runs on pooled sessions with the parcel ids
+       bound as per bind_mode (see query_inactive_lands) instead of opening a new ODBC connection.
+       If an InactiveRowCache is provided, only the parcels not queried recently are fetched."""
     
     print ('Loading SQL queries.')
     sql = load_sql()
-    
+
+    df_cached = None
+    if row_cache is not None:
+        df_cached, parcel_list = row_cache.split(parcel_list)
+        print (f'{len(parcel_list)} parcels to query, the others are cached.')
+
     print ('Execute the query.')
-    parcels_q_str = format_parcels_list(parcel_list)
+    if df_cached is not None and not parcel_list:
+        df_inact_lands = df_cached.iloc[:0]
+
+    elif pool is not None:
+        df_inact_lands = query_inactive_lands(pool, parcel_list, bind_mode=bind_mode)
+
+    else:
+        print('Connecting to BCGW.')
+        driver = oracle_driv #'Oracle in OraClient12Home2'
+        server = config.CONNSERVER
+        port = config.CONNPORT
+        dbq = config.CONNDBQ
 
-    query = sql['inactive_lands'].format(prcl=parcels_q_str)# add the parcels list to the SQL query
+        connection = connect_to_DB(driver,server,port,dbq,bcgw_user,bcgw_pwd)
+        try:
+            # padded 1000-id IN lists of ? binds: one SQL text for all the chunks of the single connection
+            df_inact_lands = query_parcels_chunks(lambda: nullcontext(connection), sql['inactive_lands'],
+                                                  parcel_list, max_workers=1, style='qmark')
+        finally:
+            connection.close()
 
-    df_inact_lands = read_query(connection,query) #execute the query and store results in a dataframe
+    if row_cache is not None:
+        row_cache.put(parcel_list, df_inact_lands)
+        row_cache.save()
+        if df_cached is not None and len(df_cached):
+            df_inact_lands = sort_inactive(pd.concat([df_cached, df_inact_lands], ignore_index=True))
 
     print ('Retrieve Inactive info.')
     ilrr_info = get_inact_info(df_inact_lands)
@@ -152,23 +376,22 @@ def execute_process(parcel_list,bcgw_user,bcgw_pwd,oracle_driv):
 
 if __name__=="__main__":
 
-    bcgw_user = ''
-    bcgw_pwd = ''
+    aoi = ''              # AOI datasource (shp, <gdb>/<feature class>, gpkg)
+    parcel_source = ''    # optional local copy of WHSE_TANTALIS.TA_INTEREST_PARCEL_SHAPES
+
+    from modules.connection_pool import get_session_pool, close_session_pool
+    pool = get_session_pool(config.HOSTNAME)
 
-    aoi = ''
-    
     print ('Retrieving the parcels list')
-    sde = r"h:\arcpro\bcgw.sde"
-    parcel_fc = os.path.join(sde, r'WHSE_TANTALIS.TA_INTEREST_PARCEL_SHAPES')
-    clip_parcel = arcpy.Clip_analysis(parcel_fc, aoi, r"memory\parcel_clip")
-    result = int(arcpy.GetCount_management(clip_parcel).getOutput(0))
-    print('{} has {} records'.format("Tantalis Parcels", result))
-    if result > 0:
-        parcel_list = [row[0] for row in arcpy.da.SearchCursor(clip_parcel,['INTRID_SID'])]
-        print(len(parcel_list))
-        drvr = get_oracle_driver()
-        ilrr = execute_process(parcel_list,bcgw_user,bcgw_pwd,drvr)
+    path, layer = split_datasource(aoi)
+    aoi_gdf = gpd.read_file(path, layer=layer, engine='pyogrio')
+    parcel_list = discover_parcels(aoi_gdf, pool=pool, parcel_source=parcel_source or None)
+    print('{} has {} records'.format("Tantalis Parcels", len(parcel_list)))
+    if parcel_list:
+        ilrr = execute_process(parcel_list, None, None, None, pool=pool)
         print(ilrr)
 
     else:
-        print("No interest parcels returned!")
\ No newline at end of file
+        print("No interest parcels returned!")
+
+    close_session_pool()
@@ -0,0 +1,245 @@
+'''
+Spatial-index snapshots of heavy local layers.
+
+A snapshot is a copy of a file datasource stored as a spatially sorted
+(Hilbert curve) GeoParquet file, plus an index file holding the bounding
+box of every row group. Reads only load the row groups that intersect the
+search area. A snapshot is rebuilt automatically when the source file's
+modification time or size changes. Each build writes a new parquet file
+and then atomically replaces the index that names it, so readers never see
+a partial snapshot.
+
+Build snapshots of the layers used in most reports with:
+    python modules/layer_snapshot.py <datasource> [<datasource> ...]
+'''
+import os
+import re
+import sys
+import glob
+import json
+import hashlib
+import contextlib
+import threading
+import numpy as np
+import pyarrow.parquet as pq
+import shapely
+import geopandas as gpd
+from pyproj import CRS
+from shapely import STRtree
+from pathlib import Path
+
+# Use main scripts dir for the project path
+current_script_path = Path(__file__).resolve().parents[1]
+sys.path.append(str(current_script_path))
+
+from modules.cache_utils import cache_path, read_json, write_json
+
+
+DEFAULT_ROW_GROUP_SIZE = 10000
+
+
+def split_datasource(datasource):
+    """Returns (path, layer) of a spreadsheet datasource.
+       Feature classes are given as <path>.gdb/<feature class>; other formats have no layer."""
+    datasource = datasource.strip()
+    if '.gdb' in datasource and not datasource.rstrip('\\/').endswith('.gdb'):
+        gdb = datasource.split('.gdb')[0] + '.gdb'
+        return gdb, re.split(r'[\\/]', datasource.rstrip('\\/'))[-1]
+
+    return datasource, None
+
+
+def source_signature(path):
+    """Returns the modification time and size of a datasource (summed over the files of a gdb folder)"""
+    if os.path.isdir(path):
+        stats = [os.stat(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files]
+    elif path.lower().endswith('.shp'):
+        # shapefiles are several files sharing the same base name
+        folder, base = os.path.split(os.path.splitext(path)[0])
+        folder = folder or '.'
+        stats = [os.stat(os.path.join(folder, f)) for f in os.listdir(folder)
+                 if os.path.splitext(f)[0] == base]
+    else:
+        stats = [os.stat(path)]
+
+    return {'mtime': max(s.st_mtime for s in stats), 'size': sum(s.st_size for s in stats)}
+
+
+
+class LayerSnapshot:
+    def __init__(self, datasource, snapshot_dir=None, row_group_size=DEFAULT_ROW_GROUP_SIZE):
+        """
+        Initialize the LayerSnapshot. Nothing is read until the snapshot is used.
+
+        Args:
+            datasource (str): Spreadsheet datasource (shp, <gdb>/<feature class>, gpkg, ...).
+            snapshot_dir (str): Folder of the snapshot files.
+            row_group_size (int): Features per parquet row group (the unit of partial reads).
+        """
+        self.datasource = datasource.strip()
+        self.path, self.layer = split_datasource(self.datasource)
+        self.row_group_size = row_group_size
+
+        name = hashlib.sha1(self.datasource.lower().encode()).hexdigest()[:16]
+        snapshot_dir = snapshot_dir or os.path.dirname(cache_path('snapshots', name))
+        self.parquet_file = os.path.join(snapshot_dir, name + '.parquet')
+        self.index_file = os.path.join(snapshot_dir, name + '.json')
+
+        # lazy properties
+        self.index = None
+        self._parquet = None
+        self._rg_tree = None
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+
+
+    def is_valid(self):
+        """True if the snapshot exists and the source has not changed since it was built"""
+        index = read_json(self.index_file)
+        if index is None or 'parquet' not in index or not os.path.exists(self.version_file(index)):
+            return False
+        try:
+            return index['signature'] == source_signature(self.path)
+        except OSError:
+            return False
+
+
+    def version_file(self, index):
+        """Returns the parquet file an index was built with"""
+        return os.path.join(os.path.dirname(self.parquet_file), index['parquet'])
+
+
+    def build(self):
+        """Converts the datasource into a spatially sorted GeoParquet with row-group bounding boxes"""
+        print(f'..building snapshot of {self.datasource}')
+        signature = source_signature(self.path)
+
+        gdf = gpd.read_file(self.path, layer=self.layer, engine='pyogrio', use_arrow=True)
+        gdf = gdf[~gdf.geometry.isna()]
+        if len(gdf) > 0:
+            gdf = gdf.iloc[np.argsort(gdf.geometry.hilbert_distance(), kind='stable')]
+        gdf = gdf.reset_index(drop=True)
+
+        # every build writes its own parquet file (named after the source signature), to a temporary
+        # name first: the index is replaced last, so a reader never pairs it with a partial or newer file
+        version = hashlib.sha1(json.dumps(signature, sort_keys=True).encode()).hexdigest()[:12]
+        base = os.path.splitext(self.parquet_file)[0]
+        parquet_file = f'{base}.{version}.parquet'
+        tmp_file = f'{parquet_file}.{os.getpid()}.{threading.get_ident()}.tmp'
+        os.makedirs(os.path.dirname(self.parquet_file), exist_ok=True)
+        try:
+            gdf.to_parquet(tmp_file, index=False, row_group_size=self.row_group_size,
+                           write_covering_bbox=True)
+            os.replace(tmp_file, parquet_file)
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp_file)
+
+        # bounding box of every row group
+        bounds = shapely.bounds(gdf.geometry.values)
+        row_groups = []
+        for start in range(0, len(gdf), self.row_group_size):
+            b = bounds[start:start + self.row_group_size]
+            row_groups.append([float(np.nanmin(b[:, 0])), float(np.nanmin(b[:, 1])),
+                               float(np.nanmax(b[:, 2])), float(np.nanmax(b[:, 3]))])
+
+        index = {'datasource': self.datasource,
+                 'signature': signature,
+                 'crs': gdf.crs.to_wkt() if gdf.crs else None,
+                 'feature_count': len(gdf),
+                 'parquet': os.path.basename(parquet_file),
+                 'row_groups': row_groups}
+        write_json(self.index_file, index)
+
+        # files of the previous builds (a file still open by a reader on Windows is left to a later build)
+        for old in glob.glob(glob.escape(base) + '*.parquet'):
+            if old != parquet_file:
+                with contextlib.suppress(OSError):
+                    os.remove(old)
+
+        with self._lock:
+            self.index = index
+            self._parquet = None
+            self._rg_tree = None
+
+        return self
+
+
+    def ensure(self):
+        """Builds (or rebuilds) the snapshot if it is missing or stale"""
+        with self._build_lock:
+            if not self.is_valid():
+                self.build()
+
+        return self
+
+
+    def open(self):
+        """Opens the snapshot lazily: loads the index and the row-group tree once"""
+        with self._lock:
+            if self._parquet is None:
+                self.index = read_json(self.index_file)
+                self._parquet = pq.ParquetFile(self.version_file(self.index))
+                boxes = shapely.box(*np.array(self.index['row_groups']).T) if self.index['row_groups'] else []
+                self._rg_tree = STRtree(boxes)
+
+        return self
+
+
+    @property
+    def crs(self):
+        self.open()
+        return CRS.from_wkt(self.index['crs']) if self.index['crs'] else None
+
+
+    def read(self, search_area, columns=None):
+        """
+        Returns the features of the row groups that intersect the search area.
+
+        Args:
+            search_area (shapely.Geometry): Buffered AOI, in the snapshot CRS.
+            columns (list): Attribute columns to read (None reads all).
+        """
+        self.open()
+        row_groups = sorted(self._rg_tree.query(search_area, predicate='intersects').tolist())
+
+        if columns:
+            columns = [c for c in columns if c in self._parquet.schema_arrow.names] + ['geometry']
+
+        if row_groups:
+            table = self._parquet.read_row_groups(row_groups, columns=columns)
+        else:
+            table = self._parquet.schema_arrow.empty_table()
+            if columns:
+                table = table.select(columns)
+
+        df = table.drop_columns([c for c in ('bbox',) if c in table.column_names]).to_pandas()
+        geometry = shapely.from_wkb(df.pop('geometry').to_numpy())
+
+        return gpd.GeoDataFrame(df, geometry=geometry, crs=self.crs)
+
+
+
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+
+def get_snapshot(datasource):
+    """Returns the open LayerSnapshot of a datasource if one has been built, else None.
+       Stale snapshots are rebuilt from the source first."""
+    key = datasource.strip().lower()
+    with _snapshots_lock:
+        snapshot = _snapshots.get(key)
+        if snapshot is None:
+            snapshot = LayerSnapshot(datasource)
+            if not os.path.exists(snapshot.index_file):
+                return None
+            _snapshots[key] = snapshot
+
+    return snapshot.ensure()
+
+
+if __name__ == '__main__':
+    for ds in sys.argv[1:]:
+        snap = LayerSnapshot(ds).ensure()
+        print(f"{ds}: {snap.index['feature_count']} features, {len(snap.index['row_groups'])} row groups")
@@ -0,0 +1,167 @@
+'''
+Local overlay engine for file-based datasources (shapefiles, file geodatabases, geopackages).
+
+Only the features inside the buffered AOI are read from disk (bbox + mask
+pushed down to the reader), then an STRtree intersect / within-distance
+pass labels each feature like the Oracle overlay query does:
+'INTERSECT' or 'Within N m'.
+'''
+import sys
+import numpy as np
+import pyogrio
+import shapely
+import geopandas as gpd
+from pyproj import CRS
+from shapely import STRtree
+from pathlib import Path
+
+# Use main scripts dir for the project path
+current_script_path = Path(__file__).resolve().parents[1]
+sys.path.append(str(current_script_path))
+
+from modules.layer_snapshot import get_snapshot, split_datasource
+
+
+def overlay_result(intersects, radius):
+    """Returns the Oracle-style RESULT labels of a boolean intersects array"""
+    return np.where(intersects, 'INTERSECT', f'Within {radius} m')
+
+
+def distance_band_result(distances, bands):
+    """Returns the RESULT labels of an array of distances to the AOI:
+       'INTERSECT' at distance 0, else 'Within N m' for the smallest band N covering the distance."""
+    distances = np.asarray(distances, dtype=float)
+    bands = np.sort(np.asarray(bands))
+
+    labels = np.array([f'Within {b} m' for b in bands], dtype=object)
+    # features are selected within the largest band, so clamp distance rounding to it
+    pos = np.minimum(np.searchsorted(bands, distances, side='left'), len(bands) - 1)
+    result = labels[pos]
+    result[distances <= 0] = 'INTERSECT'
+
+    return result
+
+
+class LocalOverlayEngine:
+    def __init__(self, aoi_geom, aoi_crs, filter_geom=None):
+        """
+        Initialize the LocalOverlayEngine.
+
+        Args:
+            aoi_geom (shapely.Geometry): AOI geometry (single, dissolved).
+            aoi_crs: CRS of the AOI (anything accepted by pyproj).
+            filter_geom (shapely.Geometry): Simplified copy containing the AOI (PreparedAoi.simplified),
+                                            used for the reads and the primary STRtree filter.
+        """
+        self.aoi_geom = aoi_geom
+        self.aoi_crs = CRS.from_user_input(aoi_crs)
+        self.filter_geom = filter_geom if filter_geom is not None else aoi_geom
+        shapely.prepare(self.aoi_geom)   # once, before the overlay threads share it
+
+
+    def aoi_in_crs(self, crs, geom=None):
+        """Returns the AOI geometry (or another geometry in the AOI CRS) in the given CRS"""
+        geom = self.aoi_geom if geom is None else geom
+        crs = CRS.from_user_input(crs)
+        if crs == self.aoi_crs:
+            return geom
+
+        return gpd.GeoSeries([geom], crs=self.aoi_crs).to_crs(crs).iloc[0]
+
+
+    def search_area(self, crs, radius):
+        """Returns the area to read in the given CRS: the filter copy of the AOI buffered by radius.
+           The buffer is applied in the (metric) AOI CRS before the area is reprojected."""
+        area = shapely.buffer(self.filter_geom, radius) if radius > 0 else self.filter_geom
+
+        return self.aoi_in_crs(crs, area)
+
+
+    def to_overlay_crs(self, gdf, layer_crs):
+        """Returns the features read from a layer and the AOI in the CRS of the overlay: the layer CRS,
+           or the AOI CRS for geographic layers (so distances are in metres, not degrees)"""
+        if gdf.crs is None:
+            gdf = gdf.set_crs(layer_crs)
+        if CRS.from_user_input(gdf.crs).is_geographic and not self.aoi_crs.is_geographic:
+            gdf = gdf.to_crs(self.aoi_crs)
+
+        return gdf, self.aoi_in_crs(gdf.crs)
+
+
+    def read_layer(self, datasource, radius=0, columns=None, where=None):
+        """
+        Reads only the features of a datasource within radius of the AOI.
+        Uses the layer's snapshot if one has been built (not for filtered reads).
+
+        Args:
+            datasource (str): Spreadsheet datasource (shp, <gdb>/<feature class>, gpkg, ...).
+            radius (float): Search distance, in metres (AOI CRS units).
+            columns (list): Attribute columns to read (None reads all).
+            where (str): OGR SQL attribute filter (spreadsheet definition query).
+
+        Returns:
+            tuple: (gdf of candidate features, AOI geometry in the same CRS).
+                   Features of geographic layers are reprojected to the AOI CRS.
+        """
+        snapshot = None if where else get_snapshot(datasource)
+        if snapshot is not None:
+            # prebuilt snapshot: only the row groups intersecting the search area are read
+            layer_crs = snapshot.crs or self.aoi_crs
+            gdf = snapshot.read(self.search_area(layer_crs, radius), columns=columns)
+
+            return self.to_overlay_crs(gdf, layer_crs)
+
+        path, layer = split_datasource(datasource)
+
+        info = pyogrio.read_info(path, layer=layer)
+        layer_crs = info['crs'] or self.aoi_crs
+
+        gdf = gpd.read_file(path, layer=layer, engine='pyogrio',
+                            columns=columns or None, where=where or None,
+                            mask=self.search_area(layer_crs, radius))
+
+        return self.to_overlay_crs(gdf, layer_crs)
+
+
+    def overlay(self, datasource, radius=0, columns=None, where=None, bands=None):
+        """
+        Returns the features of a datasource that intersect or are within radius of the AOI,
+        with a RESULT column matching the Oracle overlay query ('INTERSECT' / 'Within N m').
+
+        If distance bands are given (e.g. [500, 1000, 5000]), features are selected within the
+        largest band and each gets its DISTANCE to the AOI and the RESULT of its band.
+        """
+        if bands:
+            radius = max(bands)
+        gdf, aoi = self.read_layer(datasource, radius, columns, where)
+        if gdf.empty:
+            gdf['RESULT'] = []
+            return gdf
+
+        # primary filter against the simplified AOI, exact predicate on the candidates only
+        geoms = gdf.geometry.values
+        tree = STRtree(geoms)
+        if self.filter_geom is not self.aoi_geom:
+            area = self.aoi_in_crs(gdf.crs or self.aoi_crs, self.filter_geom)
+        else:
+            area = aoi
+        if radius > 0:
+            idx = tree.query(area, predicate='dwithin', distance=radius)
+        else:
+            idx = tree.query(area, predicate='intersects')
+        idx.sort()
+        if area is not aoi:
+            exact = shapely.dwithin(geoms[idx], aoi, radius) if radius > 0 else shapely.intersects(geoms[idx], aoi)
+            idx = idx[exact]
+
+        gdf = gdf.iloc[idx].copy()
+        if bands:
+            gdf['DISTANCE'] = shapely.distance(geoms[idx], aoi)
+            gdf['RESULT'] = distance_band_result(gdf['DISTANCE'], bands)
+        else:
+            gdf['RESULT'] = overlay_result(shapely.intersects(geoms[idx], aoi), radius)
+        if columns:
+            extra = ['DISTANCE'] if bands else []
+            gdf = gdf[[c for c in columns if c in gdf.columns] + extra + ['RESULT', 'geometry']]
+
+        return gdf.reset_index(drop=True)
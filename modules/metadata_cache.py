@@ -0,0 +1,147 @@
+'''
+On-disk cache of BCGW geometry metadata (geometry column and SRID).
+
+Entries are keyed by OWNER.TABLE and expire after a TTL. Missing or
+expired entries are filled with a single bulk query on
+ALL_SDO_GEOM_METADATA, so a warm run makes no metadata round trips.
+Tables the bulk query does not find (views, non-spatial sources) get a
+negative entry with the same TTL: they are not queried in bulk again
+until it expires, and their metadata is looked up per table.
+'''
+import time
+import threading
+import sys
+from pathlib import Path
+
+# Use main scripts dir for the project path
+current_script_path = Path(__file__).resolve().parents[1]
+sys.path.append(str(current_script_path))
+
+from modules.cache_utils import cache_path, read_json, write_json
+
+
+DEFAULT_TTL_DAYS = 30
+MAX_BINDS = 1000  # Oracle IN-list limit
+
+
+class GeomMetadataCache:
+    def __init__(self, cache_file=None, ttl_days=DEFAULT_TTL_DAYS):
+        """
+        Initialize the GeomMetadataCache and load the cache file (if any).
+
+        Args:
+            cache_file (str): Path of the json cache file.
+            ttl_days (float): Age after which an entry is refreshed from the database.
+        """
+        self.cache_file = cache_file or cache_path('geom_metadata.json')
+        self.ttl = ttl_days * 86400
+        self._lock = threading.Lock()
+        self.entries = read_json(self.cache_file, default={})
+        self.round_trips = 0
+
+
+    @staticmethod
+    def table_key(table):
+        """Returns the OWNER.TABLE cache key of a table name.
+
+        Raises:
+            ValueError: If the name is not of the form OWNER.TABLE.
+        """
+        owner, dot, tab_name = table.strip().upper().partition('.')
+        if not dot or not owner.strip() or not tab_name.strip() or '.' in tab_name:
+            raise ValueError(f'Invalid BCGW table name {table!r}: expected OWNER.TABLE')
+
+        return f'{owner.strip()}.{tab_name.strip()}'
+
+
+    def is_fresh(self, entry):
+        return entry is not None and (time.time() - entry['cached_at']) < self.ttl
+
+
+    def get(self, table):
+        """Returns (geom_col, srid) of a table, or None if not cached, expired or not in ALL_SDO_GEOM_METADATA"""
+        with self._lock:
+            entry = self.entries.get(self.table_key(table))
+        if not self.is_fresh(entry) or entry['srid'] is None:
+            return None
+
+        return entry['geom_col'], entry['srid']
+
+
+    def put(self, table, geom_col, srid):
+        with self._lock:
+            self.entries[self.table_key(table)] = {'geom_col': geom_col,
+                                                   'srid': None if srid is None else int(srid),
+                                                   'cached_at': time.time()}
+
+
+    def fill(self, connection, tables, refresh=False):
+        """
+        Caches the metadata of all missing or expired tables with one bulk query.
+
+        Args:
+            connection: Open database connection.
+            tables (list): OWNER.TABLE names (e.g. every BCGW datasource of the spreadsheet).
+            refresh (bool): Re-query all tables, even those with fresh entries.
+        """
+        keys = set()
+        for t in tables:
+            try:
+                keys.add(self.table_key(t))
+            except ValueError as e:
+                # reported by the overlay of the dataset; the other tables are still cached
+                print(f'..skipping geometry metadata of {t!r}: {e}')
+        keys = sorted(keys)
+        if not refresh:
+            with self._lock:
+                keys = [k for k in keys if not self.is_fresh(self.entries.get(k))]
+        if not keys:
+            return
+
+        found = set()
+        cursor = connection.cursor()
+        try:
+            for i in range(0, len(keys), MAX_BINDS):
+                chunk = keys[i:i + MAX_BINDS]
+                bvars = {f't{n}': k for n, k in enumerate(chunk)}
+                query = """
+                        SELECT owner || '.' || table_name TAB_KEY, column_name GEOM_NAME, srid SP_REF
+                        FROM  ALL_SDO_GEOM_METADATA
+                        WHERE owner || '.' || table_name IN ({})
+                        """.format(','.join(':' + b for b in bvars))
+                cursor.execute(query, bvars)
+                self.round_trips += 1
+                for tab_key, geom_col, srid in cursor.fetchall():
+                    self.put(tab_key, geom_col, srid)
+                    found.add(self.table_key(tab_key))
+        finally:
+            cursor.close()
+
+        # negative entries: not queried in bulk again before the TTL
+        for k in keys:
+            if k not in found:
+                self.put(k, None, None)
+
+        print(f'..cached geometry metadata of {len(keys)} table(s)')
+
+
+    def refresh(self, connection=None, tables=None):
+        """Manually expires the cache (all tables, or only those given) and refills it if a connection is given"""
+        with self._lock:
+            if tables is None:
+                tables = list(self.entries)
+                self.entries = {}
+            else:
+                for t in tables:
+                    self.entries.pop(self.table_key(t), None)
+
+        if connection is not None and tables:
+            self.fill(connection, tables, refresh=True)
+        self.save()
+
+
+    def save(self):
+        """Writes the cache to disk"""
+        with self._lock:
+            entries = dict(self.entries)
+        write_json(self.cache_file, entries)
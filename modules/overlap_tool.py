@@ -9,26 +9,43 @@ import geopandas as gpd
 import json
 import re
 import sys
-from osgeo import ogr
+import shapely
 from shapely import wkt, wkb
 from getpass import getpass
 from pathlib import Path
-from contextlib import contextmanager
+from contextlib import contextmanager, nullcontext
 
 # Use main scripts dir for the project path
 current_script_path = Path(__file__).resolve().parents[1]
 sys.path.append(str(current_script_path))
 
+from modules.connection_pool import SessionPool
+from modules.dataset_catalogue import compile_dataset_specs, compile_def_query
+from modules.def_query import DefinitionQueryError
+from modules.datasource_cache import DatasourceInfoCache, DEFAULT_MAX_WORKERS as DEFAULT_INFO_WORKERS
+from modules.overlay_executor import OverlayExecutor, DEFAULT_MAX_WORKERS
+from modules.local_overlay import LocalOverlayEngine, distance_band_result
+from modules.statement_cache import StatementCache
+from modules.aoi_staging import OracleAoiStage, staged_query
+from modules.aoi_prep import prepare_aoi
+from modules.query_fetch import iter_batches, read_arrow, DEFAULT_ARRAYSIZE, DEFAULT_PREFETCHROWS
+
+DEFAULT_DISTANCE_BANDS = (500, 1000, 5000)  # same distances as the AOI buffers of the HTML maps
+
 
 class GeoDataProcessor:
-    def __init__(self, input_json):
+    def __init__(self, input_json, info_cache=None, max_workers=DEFAULT_INFO_WORKERS):
         """
         Initialize with the input JSON data.
 
         Args:
             input_json (dict): Input JSON data.
+            info_cache (DatasourceInfoCache): Datasource introspection cache (created if not provided).
+            max_workers (int): Number of datasources opened in parallel by process_all_entries.
         """
         self.data = input_json
+        self.info_cache = info_cache or DatasourceInfoCache()
+        self.max_workers = max_workers
 
     def process_entry(self, entry):
         """Process a single entry and generate the spatial query summary."""
@@ -73,6 +90,9 @@ class GeoDataProcessor:
     def process_all_entries(self):
         """Process all entries in the JSON file."""
         if isinstance(self.data, list):
+            # open each distinct datasource once, in parallel
+            tables = [entry.get("table_summary", {}).get("table") for entry in self.data]
+            self.info_cache.fill(tables, max_workers=self.max_workers)
             return [self.process_entry(entry) for entry in self.data]
         elif isinstance(self.data, dict):
             return self.process_entry(self.data)
@@ -81,7 +101,7 @@ class GeoDataProcessor:
 
     def determine_data_type(self, table_name):
         """
-        Determine the data type using GDAL/OGR.
+        Determine the data type using GDAL/OGR (cached).
 
         Args:
             table_name (str): Name or path of the table.
@@ -89,35 +109,26 @@ class GeoDataProcessor:
         Returns:
             str: Data type (e.g., "shapefile", "file geodatabase", "oracle").
         """
-        driver_name = None
-        try:
-            datasource = ogr.Open(table_name)
-            if datasource:
-                driver_name = datasource.GetDriver().GetName()
-                datasource = None
-        except Exception as e:
-            driver_name = "unknown"
-        return driver_name or "unknown"
+        if not table_name:
+            return "unknown"
+        return self.info_cache.get(table_name)['driver'] or "unknown"
 
     def extract_srid(self, table_name):
         """
-        Extract the spatial reference ID (SRID) using GDAL/OGR.
+        Extract the spatial reference ID (SRID) using GDAL/OGR (cached).
 
         Args:
             table_name (str): Name or path of the table.
 
         Returns:
-            int: SRID value.
+            int: SRID value, or None if OGR cannot open the table (e.g. a BCGW table).
         """
-        try:
-            datasource = ogr.Open(table_name)
-            if datasource:
-                layer = datasource.GetLayer()
-                spatial_ref = layer.GetSpatialRef()
-                datasource = None
-                return int(spatial_ref.GetAuthorityCode(None)) if spatial_ref else 3005
-        except Exception as e:
-            return 3005  # Default to 4326 if extraction fails
+        if not table_name:
+            return None
+        info = self.info_cache.get(table_name)
+        if info['driver'] == 'unknown' and not info.get('error'):
+            return None
+        return info['srid'] or 3005  # Default to BC Albers if extraction fails
 
     def generate_overlay_query(self, query, buffer_distance):
         """
@@ -143,32 +154,187 @@ class GeoDataProcessor:
 
 
 class UniversalOverlapTool:
-    def __init__(self, aoi, spreadsheet, connection=None, logger=None):
+    def __init__(self, aoi, spreadsheet, connection=None, logger=None, max_workers=DEFAULT_MAX_WORKERS,
+                 metadata_cache=None, arraysize=DEFAULT_ARRAYSIZE, prefetchrows=DEFAULT_PREFETCHROWS,
+                 binary_geometry=True, distance_bands=None, stage_aoi=True):
         """
         Initialize the UniversalOverlapTool.
 
         Args:
-
+            aoi (gpd.GeoDataFrame): Area of interest.
+            spreadsheet: Status spreadsheet DataFrame or records (one dataset per row), or its compiled DatasetSpecs.
+            max_workers (int): Number of overlay queries run concurrently (requires a SessionPool).
+            metadata_cache (GeomMetadataCache): Cache of geometry columns and SRIDs (optional).
+            arraysize (int): Rows fetched per round trip when reading query results.
+            prefetchrows (int): Rows returned with the execute round trip.
+            binary_geometry (bool): Transfer geometries as WKB (BLOB) instead of WKT (CLOB).
+            distance_bands (list): Distances (e.g. DEFAULT_DISTANCE_BANDS) to classify features into.
+                                   Each dataset is queried once at its largest distance and the
+                                   features are banded client-side by their exact distance to the AOI.
+            stage_aoi (bool): Upload the AOI once per session into a temporary table joined by the
+                              overlay queries, instead of binding the AOI WKB to every query.
         """
         self.aoi = aoi
         self.spreadsheet = spreadsheet
         
-        self.connection = connection   ##accept connection for now
+        self.connection = connection   ##SessionPool (preferred) or a single open connection
         self.logger = logger  ##accept logger from caller.
 
+        # A single connection cannot run queries concurrently
+        self.max_workers = max_workers if isinstance(connection, SessionPool) else 1
+        self.metadata_cache = metadata_cache
+        self.arraysize = arraysize
+        self.prefetchrows = prefetchrows
+        self.binary_geometry = binary_geometry
+        self.distance_bands = distance_bands
+        self.stage_aoi = stage_aoi
+        self.aoi_stage = None
+
+        self.statements = StatementCache()
+        self.specs = []
+        self.results = []
+
     def main(self):
-        pass
+        """Runs the overlay of every dataset of the spreadsheet against the AOI:
+           BCGW tables in Oracle, file datasources with the local overlay engine.
+           Returns a list of OverlayResult, in spreadsheet order."""
+        sql = self.load_queries(binary=self.binary_geometry)
+
+        prepared = prepare_aoi(self.aoi)
+        wkb_aoi, srid = prepared.wkb, prepared.srid
+        local_engine = LocalOverlayEngine(prepared.geometry, prepared.crs, filter_geom=prepared.simplified)
+
+        self.specs = compile_dataset_specs(self.spreadsheet)
+        tasks = []
+        local_tasks = []
+        for spec in self.specs:
+            if spec.source_type == 'oracle':
+                tasks.append((spec.name, (spec, sql, wkb_aoi, srid)))
+            elif spec.table:
+                local_tasks.append((spec.name, (spec, local_engine)))
+
+        if self.stage_aoi and tasks:
+            self.aoi_stage = OracleAoiStage(wkb_aoi, srid)
+
+        if tasks and (self.metadata_cache is not None or self.aoi_stage is not None):
+            with self.session() as connection:
+                if self.metadata_cache is not None:
+                    # one bulk metadata query for all tables not cached yet
+                    self.metadata_cache.fill(connection, [task[0].table for _, task in tasks])
+                if self.aoi_stage is not None and not self.aoi_stage.ensure_table(connection):
+                    self.aoi_stage = None
+
+        print(f'\nRunning {len(tasks)} overlay queries ({self.max_workers} workers)')
+        executor = OverlayExecutor(self.session, self.run_overlay, max_workers=self.max_workers)
+        results = executor.run(tasks)
+
+        print(f'\nRunning {len(local_tasks)} local overlays')
+        local_executor = OverlayExecutor(nullcontext, self.run_local_overlay, max_workers=self.max_workers)
+        local_results = local_executor.run(local_tasks)
+
+        if self.metadata_cache is not None:
+            self.metadata_cache.save()
+
+        # merge both result sets back into spreadsheet order
+        position = {id(spec): i for i, spec in enumerate(self.specs)}
+        ordered = sorted(zip([t[1][0] for t in tasks + local_tasks], results + local_results),
+                         key=lambda x: position[id(x[0])])
+        self.results = [r for _, r in ordered]
+        for i, r in enumerate(self.results):
+            r.index = i
+
+        stats = self.statements.stats()
+        print(f"..{stats['distinct_statements']} distinct SQL statements for {stats['executions']} executions")
+
+        failed = [r for r in self.results if r.status != 'SUCCESS']
+        if failed:
+            print(f'..{len(failed)} dataset(s) failed: ' + ', '.join(str(r.name) for r in failed))
+
+        return self.results
+
+
+    def run_local_overlay(self, connection, task):
+        """Runs the overlay of one file datasource. Returns a gdf of the overlapping features."""
+        spec, local_engine = task
+
+        return local_engine.overlay(spec.table, radius=spec.radius, columns=spec.columns, where=spec.where,
+                                    bands=self.get_bands(spec))
+
+
+    def get_bands(self, spec):
+        """Returns the distance bands of a dataset (its own buffer distance included), or None"""
+        if not self.distance_bands:
+            return None
+
+        return sorted({b for b in self.distance_bands if b > 0} | ({spec.radius} if spec.radius > 0 else set()))
+
+
+    def run_overlay(self, connection, task):
+        """Runs the overlay query of one BCGW dataset. Returns a gdf of the overlapping features."""
+        spec, sql, wkb_aoi, srid = task
+        if spec.error:
+            raise DefinitionQueryError(spec.error)
+
+        cached = self.metadata_cache.get(spec.table) if self.metadata_cache is not None else None
+        if cached:
+            geom_col, srid_t = cached
+        else:
+            geom_col = self.get_geom_colname(connection, spec.table, sql['geomCol'])
+            srid_t = self.get_geom_srid(connection, spec.table, geom_col, sql['srid'])
+            if self.metadata_cache is not None:
+                self.metadata_cache.put(spec.table, geom_col, srid_t)
+
+        # single pass over all distance bands: query at the largest one, band client-side
+        bands = self.get_bands(spec)
+        template = 'overlay_distance' if bands else 'overlay_wkb'
+        radius = max(bands) if bands else spec.radius
+
+        # AOI staged once in this session: join the staging table instead of sending the WKB
+        if self.aoi_stage is not None and self.aoi_stage.stage(connection, srid_t):
+            template += '_staged'
+            bvars = self.aoi_stage.bind_vars(srid_t)
+        else:
+            bvars = {'wkb_aoi': wkb_aoi, 'srid': int(srid), 'srid_t': int(srid_t)}
+        bvars['radius'] = radius
+        bvars.update(spec.def_binds)
+
+        # radius and AOI are bind variables: one SQL text per (table, columns, def-query) shape
+        query = self.statements.get(template, sql[template], cols=spec.columns, tab=spec.table,
+                                    geom_col=geom_col, def_query=spec.def_query)
+
+        df = self.read_query(connection, query, bvars)
+        if bands:
+            df['RESULT'] = distance_band_result(df['DISTANCE'], bands)
+
+        return self.df_2_gdf(df, srid_t)
+
+
+    @contextmanager
+    def session(self):
+        """Yields a database connection: a pooled session if a SessionPool was provided"""
+        if isinstance(self.connection, SessionPool):
+            with self.connection.acquire() as connection:
+                yield connection
+        else:
+            yield self.connection
 
 
     def read_query(self, connection, query, bvars):
         "Returns a df containing SQL Query results"
-        cursor = connection.cursor()
-        cursor.execute(query, bvars)
-        names = [x[0] for x in cursor.description]
-        rows = cursor.fetchall()
-        df = pd.DataFrame(rows, columns=names)
+        self.statements.record(query)
+        table = read_arrow(connection, query, bvars,
+                           arraysize=self.arraysize, prefetchrows=self.prefetchrows)
+        df = table.to_pandas()
         
         return df    
+
+
+    def iter_query(self, connection, query, bvars, as_arrow=True):
+        """Yields SQL Query results in columnar chunks of arraysize rows
+           (Arrow record batches, or dfs if as_arrow is False)"""
+        self.statements.record(query)
+        yield from iter_batches(connection, query, bvars, arraysize=self.arraysize,
+                                prefetchrows=self.prefetchrows, as_arrow=as_arrow)
     
             
     @staticmethod
@@ -192,10 +358,17 @@ class UniversalOverlapTool:
 
 
 
+    @staticmethod
     def df_2_gdf (df, crs):
-        """ Return a geopandas gdf based on a df with Geometry column"""
-        df['SHAPE'] = df['SHAPE'].astype(str)
-        df['geometry'] = gpd.GeoSeries.from_wkt(df['SHAPE'])
+        """ Return a geopandas gdf based on a df with Geometry column (WKB or WKT)"""
+        shapes = df['SHAPE'].to_numpy()
+        first = df['SHAPE'].first_valid_index()
+        if first is not None and isinstance(df['SHAPE'].loc[first], (bytes, bytearray)):
+            # binary mode: one vectorized decode of all the WKB values
+            df['geometry'] = gpd.GeoSeries(shapely.from_wkb(shapes), index=df.index)
+        else:
+            df['SHAPE'] = df['SHAPE'].astype(str)
+            df['geometry'] = gpd.GeoSeries.from_wkt(df['SHAPE'])
         gdf = gpd.GeoDataFrame(df, geometry='geometry')
         #df['geometry'] = df['SHAPE'].apply(wkt.loads)
         #gdf = gpd.GeoDataFrame(df, geometry = df['geometry'])
@@ -206,37 +379,25 @@ class UniversalOverlapTool:
 
 
 
+    @staticmethod
     def multipart_to_singlepart(gdf):
-        """Converts a multipart gdf to singlepart gdf """
-        gdf['dissolvefield'] = 1
-        gdf = gdf.dissolve(by='dissolvefield')
-        gdf.reset_index(inplace=True)
-        gdf = gdf[['geometry']] #remove all columns
-            
-        return gdf
+        """Merges the features of a gdf into a single 2D geometry (see prepare_aoi)"""
+        prepared = prepare_aoi(gdf)
 
+        return gpd.GeoDataFrame(geometry=[prepared.geometry], crs=prepared.crs)
 
 
+
+    @staticmethod
     def get_wkb_srid (gdf):
-        """Returns SRID and WKB objects from gdf"""
-        print(f"gdf: {type(gdf)}")
+        """Returns the 2D WKB of the first geometry of a gdf, and its SRID"""
         srid = gdf.crs.to_epsg()
-        
-        geom = gdf['geometry']
-        print(f"geom: {type(geom)}")
-
-        wkb_aoi = geom.to_wkb().iloc[0]
+        wkb_aoi = shapely.to_wkb(shapely.force_2d(gdf.geometry.values[0]))
 
-        geom = gdf['geometry'].iloc[0]
-        
-        # if geometry has Z values, flatten geometry
-        if geom.has_z:
-            wkb_aoi = wkb.dumps(geom, output_dimension=2)
-            
-        
         return wkb_aoi, srid
         
 
+    @staticmethod
     def get_table_cols (item_index,df_stat):
         """Returns table and field names from the AST datasets spreadsheet"""
         #df_stat = df_stat.loc[df_stat['Featureclass_Name(valid characters only)'] == item]
@@ -274,37 +435,24 @@ class UniversalOverlapTool:
 
             
 
+    @staticmethod
     def get_def_query (item_index,df_stat):
-        """Returns an ORacle SQL formatted def query (if any) from the AST datasets spreadsheet"""
+        """Returns an ORacle SQL formatted def query (if any) from the AST datasets spreadsheet,
+           and its bind variables"""
         #df_stat = df_stat.loc[df_stat['Featureclass_Name(valid characters only)'] == item]
         df_stat_item = df_stat.loc[[item_index]]
         df_stat_item.fillna(value='nan',inplace=True)
 
         def_query = df_stat_item['Definition_Query'].iloc[0].strip()
 
-        def_query = def_query.strip()
-        
         if def_query == 'nan':
-            def_query = " "
-            
-        else:
-            def_query = def_query.replace('"', '')
-            def_query = re.sub(r'(\bAND\b)', r'\1 b.', def_query)
-            def_query = re.sub(r'(\bOR\b)', r'\1 b.', def_query)
-            
-            if def_query[0] == "(":
-                def_query = def_query.replace ("(", "(b.") 
-                def_query = "(" + def_query + ")"
-            else:
-                def_query = "b." + def_query
-            
-            def_query = 'AND (' + def_query + ')'
-        
+            def_query = None
         
-        return def_query
+        return compile_def_query(def_query)
 
 
 
+    @staticmethod
     def get_radius (item_index, df_stat):
         """Returns the buffer distance (if any) from the AST common datasets spreadsheet"""
         #df_stat = df_stat.loc[df_stat['Featureclass_Name(valid characters only)'] == item]
@@ -316,7 +464,9 @@ class UniversalOverlapTool:
         return radius
 
 
-    def load_queries():
+    @staticmethod
+    def load_queries(binary=False):
+        """Returns a dict of SQL queries. If binary, geometries are returned as WKB instead of WKT."""
         sql = {}
 
         sql ['aoi'] = """
@@ -325,8 +475,8 @@ class UniversalOverlapTool:
                         FROM  WHSE_TANTALIS.TA_CROWN_TENURES_SVW a
                         
                         WHERE a.CROWN_LANDS_FILE = :file_nbr
-                            AND a.DISPOSITION_TRANSACTION_SID = :disp_id
-                            AND a.INTRID_SID = :parcel_id
+                            AND a.DISPOSITION_TRANSACTION_SID = NVL(:disp_id, a.DISPOSITION_TRANSACTION_SID)
+                            AND a.INTRID_SID = NVL(:parcel_id, a.INTRID_SID)
                     """
                             
         sql ['geomCol'] = """
@@ -351,7 +501,7 @@ class UniversalOverlapTool:
                         
                             CASE WHEN SDO_GEOM.SDO_DISTANCE(b.{geom_col}, a.SHAPE, 0.5) = 0 
                                 THEN 'INTERSECT' 
-                                ELSE 'Within ' || TO_CHAR({radius}) || ' m'
+                                ELSE 'Within ' || TO_CHAR(:radius) || ' m'
                                 END AS RESULT,
                                 
                             SDO_UTIL.TO_WKTGEOMETRY(b.{geom_col}) SHAPE
@@ -362,7 +512,7 @@ class UniversalOverlapTool:
                             AND a.DISPOSITION_TRANSACTION_SID = :disp_id
                             AND a.INTRID_SID = :parcel_id
                             
-                            AND SDO_WITHIN_DISTANCE (b.{geom_col}, a.SHAPE,'distance = {radius}') = 'TRUE'
+                            AND SDO_WITHIN_DISTANCE (b.{geom_col}, a.SHAPE, 'distance = ' || :radius) = 'TRUE'
                             
                             {def_query}  
                         """ 
@@ -372,7 +522,7 @@ class UniversalOverlapTool:
                         
                             CASE WHEN SDO_GEOM.SDO_DISTANCE(b.{geom_col}, SDO_GEOMETRY(:wkb_aoi, :srid_t), 0.5) = 0 
                                 THEN 'INTERSECT' 
-                                ELSE 'Within ' || TO_CHAR({radius}) || ' m'
+                                ELSE 'Within ' || TO_CHAR(:radius) || ' m'
                                 END AS RESULT,
                                 
                             SDO_UTIL.TO_WKTGEOMETRY(b.{geom_col}) SHAPE
@@ -380,20 +530,42 @@ class UniversalOverlapTool:
                         FROM {tab} b
                         
                         WHERE SDO_WITHIN_DISTANCE (b.{geom_col}, 
-                                                SDO_GEOMETRY(:wkb_aoi, :srid),'distance = {radius}') = 'TRUE'
+                                                SDO_GEOMETRY(:wkb_aoi, :srid), 'distance = ' || :radius) = 'TRUE'
+                            {def_query}   
+                        """ 
+
+        sql ['overlay_distance'] = """
+                        SELECT {cols},
+                        
+                            SDO_GEOM.SDO_DISTANCE(b.{geom_col}, SDO_CS.TRANSFORM(SDO_GEOMETRY(:wkb_aoi, :srid), :srid_t), 0.5) DISTANCE,
+                                
+                            SDO_UTIL.TO_WKTGEOMETRY(b.{geom_col}) SHAPE
+                        
+                        FROM {tab} b
+                        
+                        WHERE SDO_WITHIN_DISTANCE (b.{geom_col}, 
+                                                SDO_GEOMETRY(:wkb_aoi, :srid), 'distance = ' || :radius) = 'TRUE'
                             {def_query}   
                         """ 
+
+        # same queries joining the AOI staging table
+        for name in ('overlay_wkb', 'overlay_distance'):
+            sql[name + '_staged'] = staged_query(sql[name])
+
+        if binary:
+            sql = {k: v.replace('SDO_UTIL.TO_WKTGEOMETRY', 'SDO_UTIL.TO_WKBGEOMETRY') for k, v in sql.items()}
+
         return sql
 
 
 
-    def get_geom_colname (connection,cursor,table,geomQuery):
+    def get_geom_colname (self,connection,table,geomQuery):
         """ Returns the geometry column of BCGW table name: can be either SHAPE or GEOMETRY"""
         el_list = table.split('.')
 
         bvars_geom = {'owner':el_list[0].strip(),
                     'tab_name':el_list[1].strip()}
-        df_g = self.read_query(connection,cursor,geomQuery, bvars_geom)
+        df_g = self.read_query(connection,geomQuery, bvars_geom)
         
         geom_col = df_g['GEOM_NAME'].iloc[0]
 
@@ -401,11 +573,11 @@ class UniversalOverlapTool:
 
 
 
-    def get_geom_srid (connection,cursor,table,geom_col,sridQuery):
+    def get_geom_srid (self,connection,table,geom_col,sridQuery):
         """ Returns the SRID of the BCGW table"""
 
         sridQuery = sridQuery.format(tab=table,geom_col=geom_col)
-        df_s = self.read_query(connection,cursor,sridQuery,{})
+        df_s = self.read_query(connection,sridQuery,{})
         
         srid_t = df_s['SP_REF'].iloc[0]
 
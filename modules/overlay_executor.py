@@ -0,0 +1,107 @@
+'''
+Concurrent execution of the per-dataset overlay queries.
+
+Every row of the status spreadsheet is an independent query, so they are
+spread over a fixed number of worker threads. Each worker holds one pooled
+session for its lifetime, results are returned in dataset order and a
+failing dataset is recorded without cancelling the others.
+'''
+import time
+import queue
+import threading
+import traceback
+
+
+DEFAULT_MAX_WORKERS = 4
+
+
+class OverlayResult:
+    """Outcome of the overlay of one dataset"""
+    __slots__ = ('index', 'name', 'status', 'data', 'error', 'elapsed_s')
+
+    def __init__(self, index, name, status, data=None, error=None, elapsed_s=0):
+        self.index = index
+        self.name = name
+        self.status = status      # 'SUCCESS' or 'FAILED'
+        self.data = data          # gdf of overlapping features
+        self.error = error
+        self.elapsed_s = elapsed_s
+
+    def __repr__(self):
+        return f"OverlayResult({self.index}, {self.name!r}, {self.status}, {self.elapsed_s}s)"
+
+
+
+class OverlayExecutor:
+    def __init__(self, session, task_func, max_workers=DEFAULT_MAX_WORKERS):
+        """
+        Initialize the OverlayExecutor.
+
+        Args:
+            session (callable): Context manager factory yielding a database connection
+                                (e.g. UniversalOverlapTool.session).
+            task_func (callable): task_func(connection, task) runs the overlay of one dataset.
+            max_workers (int): Degree of parallelism, i.e. number of sessions used at once.
+        """
+        self.session = session
+        self.task_func = task_func
+        self.max_workers = max(1, int(max_workers))
+
+
+    def run_task(self, connection, index, name, task):
+        """Runs one task and wraps its outcome in an OverlayResult"""
+        start_t = time.perf_counter()
+        try:
+            data = self.task_func(connection, task)
+            return OverlayResult(index, name, 'SUCCESS', data=data,
+                                 elapsed_s=round(time.perf_counter() - start_t, 3))
+        except Exception as e:
+            traceback.print_exc()
+            return OverlayResult(index, name, 'FAILED', error=f'{type(e).__name__}: {e}',
+                                 elapsed_s=round(time.perf_counter() - start_t, 3))
+
+
+    def run(self, tasks):
+        """
+        Runs all tasks concurrently.
+
+        Args:
+            tasks (list): (name, task) tuples, one per dataset.
+
+        Returns:
+            list: OverlayResult objects, in the same order as tasks.
+        """
+        results = [None] * len(tasks)
+
+        task_queue = queue.Queue()
+        for i, (name, task) in enumerate(tasks):
+            task_queue.put((i, name, task))
+
+        def worker():
+            # one session per worker, kept for all the datasets it processes
+            try:
+                with self.session() as connection:
+                    while True:
+                        try:
+                            i, name, task = task_queue.get_nowait()
+                        except queue.Empty:
+                            return
+                        results[i] = self.run_task(connection, i, name, task)
+                        print(f"..overlay {i + 1} of {len(tasks)}: {name} - {results[i].status}")
+            except Exception as e:
+                # the session could not be acquired: leave the tasks to the other workers
+                traceback.print_exc()
+
+        n_workers = min(self.max_workers, len(tasks))
+        threads = [threading.Thread(target=worker, name=f'overlay-{n}') for n in range(n_workers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        # tasks left over if every worker failed to get a session
+        for i, (name, task) in enumerate(tasks):
+            if results[i] is None:
+                results[i] = OverlayResult(i, name, 'FAILED', error='No database session available')
+
+        return results
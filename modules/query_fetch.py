@@ -0,0 +1,112 @@
+'''
+Streaming fetch of Oracle query results.
+
+Rows are fetched with fetchmany in batches of `arraysize` and turned into
+columnar chunks (Arrow record batches or DataFrames), so large layers can
+be iterated without materializing every row tuple in one Python list.
+'''
+import oracledb
+import pyarrow as pa
+import pandas as pd
+
+
+DEFAULT_ARRAYSIZE = 5000
+DEFAULT_PREFETCHROWS = 5000
+
+
+def lob_output_handler(cursor, metadata):
+    """Fetches CLOB/BLOB columns inline as str/bytes instead of one LOB locator
+       (and one extra round trip) per row."""
+    if metadata.type_code is oracledb.DB_TYPE_CLOB:
+        return cursor.var(oracledb.DB_TYPE_LONG, arraysize=cursor.arraysize)
+    if metadata.type_code is oracledb.DB_TYPE_BLOB:
+        return cursor.var(oracledb.DB_TYPE_LONG_RAW, arraysize=cursor.arraysize)
+
+
+def arrow_type(column):
+    """
+    Returns the Arrow type of a cursor.description column, or None to infer it from the values.
+
+    oracledb returns int for the integral values of a NUMBER column and float for the others,
+    so types inferred per batch can differ between the batches of one result. NUMBER columns
+    get one type from their declared precision and scale instead (unconstrained NUMBER, e.g.
+    SDO_DISTANCE or COUNT(*), as double).
+    """
+    type_code, precision, scale = column[1], column[4], column[5]
+    if type_code is oracledb.DB_TYPE_NUMBER:
+        return pa.int64() if scale == 0 and precision and precision <= 18 else pa.float64()
+    if type_code in (oracledb.DB_TYPE_BINARY_DOUBLE, oracledb.DB_TYPE_BINARY_FLOAT):
+        return pa.float64()
+    if type_code is oracledb.DB_TYPE_BINARY_INTEGER:
+        return pa.int64()
+    if type_code in (oracledb.DB_TYPE_VARCHAR, oracledb.DB_TYPE_NVARCHAR, oracledb.DB_TYPE_CHAR,
+                     oracledb.DB_TYPE_NCHAR, oracledb.DB_TYPE_LONG, oracledb.DB_TYPE_CLOB, oracledb.DB_TYPE_NCLOB):
+        return pa.string()
+    if type_code in (oracledb.DB_TYPE_RAW, oracledb.DB_TYPE_LONG_RAW, oracledb.DB_TYPE_BLOB):
+        return pa.binary()
+    if type_code in (oracledb.DB_TYPE_DATE, oracledb.DB_TYPE_TIMESTAMP):
+        return pa.timestamp('us')
+
+    return None
+
+
+def record_batch(names, types, columns):
+    """Returns a RecordBatch of column value lists, with the given types (None: inferred)"""
+    arrays = [pa.array(values, type=t) for values, t in zip(columns, types)]
+
+    return pa.RecordBatch.from_arrays(arrays, names=names)
+
+
+def iter_batches(connection, query, bvars=None, arraysize=DEFAULT_ARRAYSIZE,
+                 prefetchrows=DEFAULT_PREFETCHROWS, as_arrow=True):
+    """
+    Executes a query and yields its result in columnar chunks.
+
+    Args:
+        connection: Open database connection.
+        query (str): SQL query.
+        bvars (dict): Bind variables.
+        arraysize (int): Rows per fetchmany call (and per yielded chunk).
+        prefetchrows (int): Rows returned with the execute round trip.
+        as_arrow (bool): Yield pyarrow RecordBatch objects, else pandas DataFrames.
+
+    Yields:
+        pa.RecordBatch or pd.DataFrame: One chunk of at most arraysize rows.
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.arraysize = arraysize
+        cursor.prefetchrows = prefetchrows
+        cursor.outputtypehandler = lob_output_handler
+        cursor.execute(query, bvars or {})
+        names = [x[0] for x in cursor.description]
+        types = [arrow_type(x) for x in cursor.description]
+
+        empty = True
+        while True:
+            rows = cursor.fetchmany(arraysize)
+            if not rows:
+                break
+            empty = False
+            columns = list(map(list, zip(*rows)))
+            del rows
+            yield record_batch(names, types, columns) if as_arrow else pd.DataFrame(dict(zip(names, columns)))
+
+        if empty:
+            # keep the schema for empty results
+            columns = [[] for name in names]
+            yield record_batch(names, types, columns) if as_arrow else pd.DataFrame(dict(zip(names, columns)))
+
+    finally:
+        cursor.close()
+
+
+def read_arrow(connection, query, bvars=None, arraysize=DEFAULT_ARRAYSIZE,
+               prefetchrows=DEFAULT_PREFETCHROWS):
+    """Returns the full query result as a pyarrow Table (built from columnar batches)"""
+    tables = [pa.Table.from_batches([batch])
+              for batch in iter_batches(connection, query, bvars, arraysize, prefetchrows, as_arrow=True)]
+
+    # the types of the columns without a fixed Arrow type are inferred per batch
+    # (e.g. an all-null batch): promote them to a common schema
+    return pa.concat_tables(tables, promote_options='permissive')
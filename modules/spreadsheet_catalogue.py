@@ -0,0 +1,140 @@
+'''
+Compiled cache of the status spreadsheets.
+
+Parsing the xlsx workbooks with openpyxl takes seconds, so each workbook
+is parsed once and stored as a pickled DataFrame keyed by its path and
+content hash (read_workbook). The compiled catalogues built from them
+(cleaned dataset records and DatasetSpecs of the overlay path in
+ASTProcessor, DataFrame and DatasetSpecs of the HTML map path in
+HTMLGenerator) are cached the same way under the content hashes of all
+their workbooks (read_compiled), so an unchanged spreadsheet is only
+parsed and compiled again when its content changes. The cache key also
+covers the code that compiles them (CATALOGUE_VERSION and the source of
+the compiling modules), so pickled records and DatasetSpecs built by an
+older version of the code are never loaded.
+'''
+import os
+import sys
+import glob
+import pickle
+import hashlib
+import contextlib
+import threading
+import pandas as pd
+from pathlib import Path
+
+# Use main scripts dir for the project path
+current_script_path = Path(__file__).resolve().parents[1]
+sys.path.append(str(current_script_path))
+
+from modules.cache_utils import cache_path
+
+
+# bump when the format of the compiled outputs changes in a way the source hash below does not catch
+CATALOGUE_VERSION = 1
+
+# modules whose code shapes the compiled outputs (cleaning, records, DatasetSpec, definition queries)
+COMPILING_MODULES = [os.path.join(current_script_path, 'modules', f) for f in
+                     ('spreadsheet_to_json.py', 'dataset_catalogue.py', 'def_query.py', 'spreadsheet_catalogue.py')]
+
+_memory = {}
+_memory_lock = threading.Lock()
+_hashes = {}
+
+
+def content_hash(path, chunk_size=1 << 20):
+    """Returns the sha256 of a file's content (memoized by path, modification time and size)"""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    with _memory_lock:
+        if key in _hashes:
+            return _hashes[key]
+
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+
+    with _memory_lock:
+        _hashes[key] = sha.hexdigest()
+
+    return _hashes[key]
+
+
+def code_version(compile_fn):
+    """Returns the hash of the code compiling an output: CATALOGUE_VERSION, the compiling modules
+       and the module defining compile_fn"""
+    sources = list(COMPILING_MODULES)
+    code = getattr(compile_fn, '__code__', None)
+    if code is not None and os.path.isfile(code.co_filename):
+        sources.append(code.co_filename)
+    hashes = [content_hash(f) for f in sources if os.path.isfile(f)]
+
+    return hashlib.sha256('|'.join([str(CATALOGUE_VERSION)] + hashes).encode()).hexdigest()
+
+
+def compiled_path(paths, digest, name):
+    """Returns the compiled cache file of a version of workbooks and code:
+       <name>_v<CATALOGUE_VERSION>_<paths hash>_<content and code hash>.pkl"""
+    paths_key = '|'.join(os.path.abspath(p).lower() for p in paths)
+    paths_key = hashlib.sha1(paths_key.encode()).hexdigest()[:16]
+
+    return cache_path('catalogue', f'{name}_v{CATALOGUE_VERSION}_{paths_key}_{digest[:32]}.pkl')
+
+
+def read_compiled(paths, name, compile_fn):
+    """
+    Returns the output of compile_fn() for a set of workbooks, compiling it only if this
+    version of the workbooks has not been compiled before by this version of the code.
+    Outputs are keyed by name, by the paths and content hashes of the workbooks and by
+    the code version.
+
+    Args:
+        paths (list): Paths of the xlsx workbooks compile_fn reads.
+        name (str): Name of the compiled output (one cache entry per name).
+        compile_fn (callable): Parses the workbooks and returns the (picklable) output.
+
+    Returns:
+        The compiled output, shared by all callers: do not modify it.
+    """
+    digest = hashlib.sha256(''.join([code_version(compile_fn)] + [content_hash(p) for p in paths]).encode()).hexdigest()
+    key = (name, tuple(os.path.abspath(p).lower() for p in paths), digest)
+
+    with _memory_lock:
+        if key in _memory:
+            return _memory[key]
+
+    compiled = compiled_path(paths, digest, name)
+    try:
+        output = pd.read_pickle(compiled)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        print(f'..compiling {name} of {", ".join(os.path.basename(p) for p in paths)}')
+        output = compile_fn()
+
+        # drop compiled versions of older content or code, then write atomically
+        paths_key = compiled.rsplit('_', 2)[1]
+        for old in glob.glob(os.path.join(glob.escape(os.path.dirname(compiled)), f'{name}_v*_{paths_key}_*.pkl')):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(old)
+        tmp = compiled + f'.{os.getpid()}.{threading.get_ident()}.tmp'
+        pd.to_pickle(output, tmp)
+        os.replace(tmp, compiled)
+
+    with _memory_lock:
+        _memory[key] = output
+
+    return output
+
+
+def read_workbook(path):
+    """
+    Returns the first sheet of an xlsx workbook as a DataFrame, parsing it only if
+    this version of the workbook has not been compiled before.
+
+    Args:
+        path (str): Path of the xlsx workbook.
+
+    Returns:
+        pd.DataFrame: A copy of the cached DataFrame (callers may modify it).
+    """
+    return read_compiled([path], 'sheet', lambda: pd.read_excel(path)).copy()
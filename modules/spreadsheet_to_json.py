@@ -28,43 +28,55 @@ def clean_dataframe( df):
     
     return df
 
-def create_spreadsheet_json(df):
+def create_spreadsheet_json(df, output_path=None):
+    """
+    Transforms the cleaned spreadsheet into a list of dataset records.
+
+    Parameters:
+        df (pd.DataFrame): Cleaned spreadsheet. Columns are positional: category,
+                           feature name, table, query, buffer, label field, then
+                           the summary fields.
+        output_path (str): Optional json file the records are streamed to.
+
+    Returns:
+        list: One {"table_summary": {...}} record per row.
+    """
+    df = df.astype(object)
+
+    # Forward-fill the category over the rows where it is not specified
+    category = df.iloc[:, 0]
+    category = category.where(category.notna() & (category != "")).ffill()
+    category = category.where(category.notna(), None)
 
-    # Define a function to transform each row into the desired JSON structure
-    def transform_row(row):
-        global last_category
+    # Collect summary_fields (columns from index 6): non-empty, non-NaN values, in column order
+    summary = df.iloc[:, 6:]
+    summary = summary.where(summary.notna() & (summary != ""))
+    summary_fields = (summary.stack(future_stack=True).dropna()
+                             .groupby(level=0, sort=False).agg(list)
+                             .reindex(df.index))
 
-        # Capture the category
-        if pd.notna(row.iloc[0]) and row.iloc[0] != "":
-            last_category = row.iloc[0]  # Update category if it is specified
+    columns = [category] + [df.iloc[:, i] for i in range(1, 6)] + [summary_fields]
+    keys = ("category", "feature_name", "table", "query", "buffer", "label_field")
 
-        # Collect summary_fields dynamically (assumes they start at column index 6)
-        summary_fields = []
-        for val in row.iloc[6:]:  # Adjust index to the last columns
-            if pd.notna(val) and val != "":  # Only add non-empty, non-NaN fields
-                summary_fields.append(val)
+    json_data = []
+    for values in zip(*(col.tolist() for col in columns)):
+        table_summary = dict(zip(keys, values[:6]))
+        table_summary["summary_fields"] = values[6] if isinstance(values[6], list) else []
+        json_data.append({"table_summary": table_summary})
 
-        # Build the JSON object dynamically
-        return {
-            "table_summary": {
-                "category": last_category,
-                "feature_name": row.iloc[1],
-                "table": row.iloc[2],
-                "query": row.iloc[3],
-                "buffer": row.iloc[4],
-                "label_field": row.iloc[5],
-                "summary_fields": summary_fields
-            }
-        }
+    if output_path:
+        write_spreadsheet_json(json_data, output_path)
 
-    # Initialize a variables to store the last valid category
-    last_category = None
+    return json_data
 
-    # Apply the transformation to each row, ignoring None results
-    json_data = [result for _, row in df.iterrows() if (result := transform_row(row)) is not None]
 
-    # Save to a JSON file
-    with open('output\output.json', 'w') as json_file:
-        json.dump(json_data, json_file, indent=4)
+def write_spreadsheet_json(json_data, output_path):
+    """Streams the dataset records to a json file, one record at a time"""
+    with open(output_path, 'w') as json_file:
+        json_file.write('[')
+        for i, record in enumerate(json_data):
+            json_file.write(',\n' if i else '\n')
+            json.dump(record, json_file, default=str)
+        json_file.write('\n]\n')
 
-    return json_file
\ No newline at end of file
+    return output_path
@@ -0,0 +1,55 @@
+'''
+Cache of generated SQL statements and statement reuse statistics.
+
+The overlay templates are formatted once per (table, columns, geometry
+column, def-query) shape and the same SQL text is returned afterwards,
+so Oracle can reuse the parsed statement. Executions are counted per SQL
+text to report how many distinct statements a run sent for how many
+executions.
+'''
+import threading
+from collections import Counter
+
+
+class StatementCache:
+    def __init__(self):
+        self._statements = {}
+        self._executions = Counter()
+        self._lock = threading.Lock()
+
+
+    def get(self, name, template, **shape):
+        """
+        Returns the SQL of a template for a statement shape, formatting it only once.
+
+        Args:
+            name (str): Template name (e.g. 'overlay_wkb').
+            template (str): SQL template with {placeholders} for the shape.
+            **shape: Values of the placeholders (table, columns, etc.). Values that vary
+                     per execution (radius, AOI) must be bind variables, not placeholders.
+        """
+        key = (name,) + tuple(sorted(shape.items()))
+        with self._lock:
+            sql = self._statements.get(key)
+            if sql is None:
+                sql = template.format(**shape)
+                self._statements[key] = sql
+
+        return sql
+
+
+    def record(self, sql):
+        """Counts one execution of a SQL text"""
+        with self._lock:
+            self._executions[sql] += 1
+
+
+    def stats(self):
+        """Returns the number of distinct statement texts vs executions"""
+        with self._lock:
+            executions = sum(self._executions.values())
+            distinct = len(self._executions)
+
+        return {'distinct_statements': distinct,
+                'executions': executions,
+                'reused_executions': executions - distinct}
@@ -214,4 +214,11 @@ def load_sql():
  
                           """    
     
+    
+    sql['parcels_aoi'] = """
+                SELECT CAST(p.INTRID_SID AS NUMBER) INTRID_SID
+                FROM WHSE_TANTALIS.TA_INTEREST_PARCEL_SHAPES p
+                WHERE SDO_ANYINTERACT (p.SHAPE, SDO_GEOMETRY(:wkb_aoi, :srid_aoi)) = 'TRUE'
+                          """
+    
     return sql
\ No newline at end of file
@@ -2,14 +2,11 @@ import re
 import os
 import timeit
 import logging
-import cx_Oracle
-import keyring
 import pandas as pd
 import geopandas as gpd
 import sys
 import traceback
 from shapely import wkt, wkb
-from getpass import getpass
 from pathlib import Path
 from contextlib import contextmanager
 
@@ -20,28 +17,36 @@ sys.path.append(str(current_script_path))
 from modules.overlap_tool import UniversalOverlapTool as uot
 from modules.spreadsheet_to_json import create_spreadsheet_json
 from modules.spreadsheet_to_json import clean_dataframe
+from modules.connection_pool import SessionPool, get_session_pool
+from modules.metadata_cache import GeomMetadataCache
+from modules.spreadsheet_catalogue import read_workbook, read_compiled
+from modules.dataset_catalogue import compile_dataset_specs
+from modules.aoi_cache import AoiCache, fetch_tenure_aoi
 
 
 from config import HOSTNAME, XLSX_DIR
 
 class ASTProcessor:
-    def __init__(self, feature, crown_file_num, disp_num, parcel_num, output_dir, connection=None, logger=None):
+    def __init__(self, feature, crown_file_num, disp_num, parcel_num, output_dir, connection=None, logger=None,
+                 shared_cache=None):
         """
         Initialize the ASTProcessor.
 
         Args:
-
+            shared_cache (SharedCache): Cache of spreadsheets, metadata, etc. shared by batch jobs (optional).
         """
         self.feature = feature
         self.crown_file_number = crown_file_num
         self.disposition_number = disp_num
         self.parcel_number = parcel_num
         self.output_directory = output_dir
-        self.connection = connection   ##pass in connection pool resource for batch. For now, use connection method below
+        self.connection = connection   ##SessionPool shared by the caller (batch runs); created in connect_to_DB otherwise
         self.logger = logger  ##accept logger from caller. For now, use logger method below.
+        self.shared_cache = shared_cache
 
         # lazy properties
         self.region = None
+        self.dataset_specs = None
 
     def main(self):
         """
@@ -51,8 +56,8 @@ class ASTProcessor:
         """
 
         self.create_output_dir()
-        conn = self.connect_to_DB() ##TODO: replace with updated module when complete; handle user inputs, updating keyring, etc.
-        # aoi = self.acquire_aoi_spatial()
+        pool = self.connect_to_DB() ##TODO: handle user inputs, updating keyring, etc.
+        aoi = self.acquire_aoi_spatial()
         self.get_aoi_region()
         json_data = self.get_regional_spreadsheets()
         # self.acquire_tab1_dataframe()
@@ -68,29 +73,41 @@ class ASTProcessor:
         ##Check if output dir writable or create output dir
 
     def connect_to_DB(self): 
-        """ Returns a connection to Oracle database"""
+        """ Returns the Oracle session pool shared by all steps of the report"""
+
+        if not isinstance(self.connection, SessionPool):
+            self.connection = get_session_pool(HOSTNAME)
 
         try:
-            dbkey = "BCGW"
-            username = os.getlogin()
-            if not keyring.get_credential(dbkey, username):
-                password = getpass("password:")
-                
-            else:
-                password = keyring.get_password(dbkey, username)
-
-            connection = cx_Oracle.connect(user=username, password=password, dsn=HOSTNAME, encoding="UTF-8")
+            self.connection.open()
             print  ("....Successffuly connected to the database")
         except Exception as e:
             print(traceback.print_exc())
             raise Exception(f'....Connection failed! Please check your login parameters - {e}')
 
-        return connection
+        return self.connection
 
     def acquire_aoi_spatial(self):
-        uot.esri_to_gdf() ##This tool specific to esri aoi input but would need to include processing for geoJSON, sqlite, etc.
-        ##get aoi as geopandas dataframe, either from file or feature class on disk or from tantalis
-        ##from crown_file_number, disposition_number, parcel_number combinations
+        """Returns the AOI as a gdf: from the input feature if provided, otherwise the
+           Tantalis tenure of the crown file/disposition/parcel numbers (from the local AOI cache
+           when this tenure was resolved recently)"""
+        if self.feature:
+            return uot.esri_to_gdf(str(self.feature)) ##This tool specific to esri aoi input but would need to include processing for geoJSON, sqlite, etc.
+
+        query = uot.load_queries(binary=True)['aoi']
+
+        def fetch():
+            with self.connection.acquire() as connection:
+                return fetch_tenure_aoi(connection, query, self.crown_file_number,
+                                        self.disposition_number, self.parcel_number)
+
+        aoi = self.get_aoi_cache().get_or_fetch(self.crown_file_number, self.disposition_number,
+                                                self.parcel_number, fetch)
+        if aoi is None:
+            raise Exception(f'....No tenure found for file {self.crown_file_number}, '
+                            f'disposition {self.disposition_number}, parcel {self.parcel_number}')
+
+        return aoi
 
     def get_aoi_region(self):
         self.region = 'cariboo'
@@ -104,18 +121,38 @@ class ASTProcessor:
             input_xlsx (str): Path to the folder containing input spreadsheets.
 
         Returns:
-            pd.DataFrame: A cleaned and merged DataFrame with processed data.
+            list: The dataset records of the cleaned and merged spreadsheets
+                  (their DatasetSpecs are set in self.dataset_specs).
         """
+        if self.shared_cache is not None:
+            # Batch runs: each region's spreadsheets are loaded once and shared by all jobs
+            catalogue = self.shared_cache.get_or_create(('spreadsheets', self.region.lower()),
+                                                        self.read_regional_spreadsheets)
+        else:
+            catalogue = self.read_regional_spreadsheets()
+
+        json_spreadsheet, self.dataset_specs = catalogue
+
+        return json_spreadsheet
+
+    def read_regional_spreadsheets(self):
+        """Returns the compiled catalogue (dataset records, DatasetSpecs) of the common and regional
+           spreadsheets, from the catalogue cache unless their content changed"""
         #input spreadsheet - MOVE TO CONFIG file
         xlxs_dir = XLSX_DIR
 
         # Construct file paths - MOVE TO CONFIG file
         common_xls = os.path.join(xlxs_dir, 'one_status_common_datasets.xlsx')
         region_xls = os.path.join(xlxs_dir, f'one_status_{self.region.lower()}_specific.xlsx')
-        
+
+        return read_compiled([common_xls, region_xls], 'status_catalogue',
+                             lambda: self.compile_regional_spreadsheets(common_xls, region_xls))
+
+    def compile_regional_spreadsheets(self, common_xls, region_xls):
+        """Reads, merges and cleans the common and regional spreadsheets. Returns (records, DatasetSpecs)."""
         # Load and merge data
-        df_common = pd.read_excel(common_xls).iloc[1:]
-        df_region = pd.read_excel(region_xls).iloc[1:]
+        df_common = read_workbook(common_xls).iloc[1:]
+        df_region = read_workbook(region_xls).iloc[1:]
         df_combined = pd.concat([df_common, df_region], ignore_index=True)
         
         # Clean the combined DataFrame
@@ -126,16 +163,29 @@ class ASTProcessor:
 
         json_spreadsheet = create_spreadsheet_json(df_cleaned)
         
-        return json_spreadsheet
+        return json_spreadsheet, compile_dataset_specs(json_spreadsheet)
+
+    def get_metadata_cache(self):
+        """Returns the geometry metadata cache (shared by all jobs of a batch)"""
+        if self.shared_cache is not None:
+            return self.shared_cache.get_or_create('geom_metadata', GeomMetadataCache)
+
+        return GeomMetadataCache()
+
+    def get_aoi_cache(self):
+        """Returns the tenure AOI cache (shared by all jobs of a batch)"""
+        if self.shared_cache is not None:
+            return self.shared_cache.get_or_create('aoi_cache', AoiCache)
+
+        return AoiCache()
 
     def acquire_tab1_dataframe(self, aoi, spreadsheet):
         pass
         #summary table of aoi (mapsheet, FN, arch, mines, forests, water, etc.)
         #Leverage query process from UniversalOverlapTool()
         #current code in inactive_dispositions.py & tantalis_bigQuery.py
-        spatial = True
-        spatial_summary = True
-        overlap_tool = uot(aoi, spreadsheet, spatial, spatial_summary)
+        overlap_tool = uot(aoi, self.dataset_specs or spreadsheet, connection=self.connection,
+                           metadata_cache=self.get_metadata_cache())
         overlap_tool.main()
 
     def acquire_tab2_dataframe(self, aoi, spreadsheets):
@@ -143,7 +193,8 @@ class ASTProcessor:
         #inactives
         #Leverage query process from UniversalOverlapTool()
         #current code in inactive_dispositions.py & tantalis_bigQuery.py
-        overlap_tool = uot(aoi, spreadsheets)
+        overlap_tool = uot(aoi, self.dataset_specs or spreadsheets, connection=self.connection,
+                           metadata_cache=self.get_metadata_cache())
         overlap_tool.main()
 
     def acquire_tab3_dataframe(self, aoi, spreadsheets):
@@ -153,7 +204,8 @@ class ASTProcessor:
         # returning dataframe and perhaps a GeoPackage of data
         # NEED PARAMETER TO STATE WHICH METRICS TO INCLUDE; spatial=True, spatial_summary=False, etc.)
         # Some returned dataframes will not require the spatial data or the summary of feature
-        overlap_tool = uot(aoi, spreadsheets)
+        overlap_tool = uot(aoi, self.dataset_specs or spreadsheets, connection=self.connection,
+                           metadata_cache=self.get_metadata_cache())
         overlap_tool.main()
 
     def generate_html_maps(Geopackage):
@@ -169,9 +221,11 @@ class ASTProcessor:
         reports = ASTReportGenerator(dataframes)
         reports.main()
 
-    def cleanup():
+    def cleanup(self):
         pass
-        #cleanup connections, scratch files, intermediate data, temp folders, etc.
+        #cleanup scratch files, intermediate data, temp folders, etc.
+        #Sessions are released back to the pool after each query; the pool itself
+        #is closed by its owner (close_session_pool) once all reports are done.
 
 if __name__ == '__main__':
     ast = ASTProcessor(feature=None, crown_file_num=None, disp_num=None, parcel_num=None, output_dir=None)
@@ -16,6 +16,7 @@ Authors:
 
 '''
 # %% Imports
+import argparse
 
 
 # %% Modules
@@ -43,4 +44,38 @@ Authors:
 
 
 # Class Mapping():
-    #
\ No newline at end of file
+    #
+
+
+# %% Batch mode
+def execute_batch(jobs_file, output_dir, max_workers, manifest_path=None):
+    """Runs every job of a CSV/JSONL jobs file in this process and writes a manifest."""
+    from modules.batch_runner import BatchRunner, read_jobs
+    from modules.connection_pool import close_session_pool
+
+    jobs = read_jobs(jobs_file)
+
+    runner = BatchRunner(jobs, output_dir, max_workers=max_workers)
+    try:
+        runner.run()
+    finally:
+        manifest = runner.write_manifest(manifest_path)
+        print(f'\nSession pool: {runner.pool.stats()}')
+        close_session_pool()
+
+    failed = [r for r in runner.manifest if r and r['status'] != 'SUCCESS']
+    print(f'\n{len(jobs) - len(failed)} of {len(jobs)} jobs succeeded. Manifest: {manifest}')
+
+    return runner.manifest
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Automated Status Tool')
+    parser.add_argument('--batch', metavar='JOBS_FILE', required=True,
+                        help='CSV or JSONL of crown_file_num, disp_num, parcel_num, feature jobs')
+    parser.add_argument('--output-dir', default='output', help='Base output folder for batch jobs')
+    parser.add_argument('--workers', type=int, default=4, help='Maximum number of concurrent reports')
+    parser.add_argument('--manifest', default=None, help='Manifest csv path (default: <output-dir>/batch_manifest.csv)')
+    args = parser.parse_args()
+
+    execute_batch(args.batch, args.output_dir, args.workers, args.manifest)
@@ -0,0 +1,33 @@
+from pathlib import Path
+import sys
+import shapely
+import geopandas as gpd
+from shapely.geometry import box
+
+# Use main scripts dir for the project path
+current_script_path = Path(__file__).resolve().parents[1]
+sys.path.append(str(current_script_path))
+
+from modules.aoi_prep import prepare_aoi
+
+
+def test_geographic_aoi_is_prepared_in_metres():
+    aoi = gpd.GeoDataFrame(geometry=[box(-123.25, 49.48, -123.24, 49.49), box(-123.24, 49.48, -123.23, 49.49)],
+                           crs='EPSG:4326')
+    prepared = prepare_aoi(aoi)
+
+    assert prepared.srid == 3005
+    expected = shapely.union_all(aoi.to_crs(3005).geometry.values)
+    # snapped to the 1 mm grid, not to a 0.001 degree (~100 m) grid
+    assert shapely.hausdorff_distance(prepared.geometry, expected) < 0.01
+    # the filter copy stays within the 1 m tolerance of the AOI
+    assert prepared.simplified.contains(prepared.geometry)
+    assert shapely.hausdorff_distance(prepared.simplified, prepared.geometry) < 2
+
+
+def test_projected_aoi_keeps_its_crs():
+    aoi = gpd.GeoDataFrame(geometry=[box(1000000, 500000, 1001000, 501000)], crs='EPSG:3005')
+    prepared = prepare_aoi(aoi)
+
+    assert prepared.srid == 3005
+    assert prepared.geometry.equals(aoi.geometry.iloc[0])
@@ -0,0 +1,111 @@
+from pathlib import Path
+import sys
+import sqlite3
+import shapely
+from shapely.geometry import box, Point
+
+# Use main scripts dir for the project path
+current_script_path = Path(__file__).resolve().parents[1]
+sys.path.append(str(current_script_path))
+
+from modules.aoi_staging import SqliteAoiStage, staged_query, sqlite_query
+
+
+# same shape as the overlay_wkb query of UniversalOverlapTool.load_queries
+OVERLAY = """
+        SELECT {cols},
+            CASE WHEN SDO_GEOM.SDO_DISTANCE(b.{geom_col}, SDO_GEOMETRY(:wkb_aoi, :srid_t), 0.5) = 0
+                THEN 'INTERSECT'
+                ELSE 'Within ' || TO_CHAR(:radius) || ' m'
+                END AS RESULT,
+            SDO_UTIL.TO_WKBGEOMETRY(b.{geom_col}) SHAPE
+        FROM {tab} b
+        WHERE SDO_WITHIN_DISTANCE (b.{geom_col},
+                                SDO_GEOMETRY(:wkb_aoi, :srid), 'distance = ' || :radius) = 'TRUE'
+            {def_query}
+        """
+
+
+def make_connection():
+    connection = sqlite3.connect(':memory:')
+    connection.execute("CREATE TABLE PARKS (NAME TEXT, SHAPE BLOB)")
+    for i in range(10):
+        connection.execute("INSERT INTO PARKS VALUES (?, ?)", (f'p{i}', shapely.to_wkb(Point(i * 100, 0))))
+
+    return connection
+
+
+def test_staged_query_joins_the_staging_table():
+    sql = staged_query(OVERLAY)
+    assert ':wkb_aoi' not in sql
+    assert 'FROM AST_AOI_STAGE a, {tab} b' in sql
+    assert 'a.AOI_KEY = :aoi_key' in sql
+
+
+def test_staged_overlay_on_sqlite():
+    connection = make_connection()
+    stage = SqliteAoiStage(shapely.to_wkb(box(-10, -10, 110, 10)), 3005)
+    stage.ensure_table(connection)
+    assert stage.stage(connection, 3005)
+    assert stage.stage(connection, 3005)   # already staged in this session
+    assert connection.execute("SELECT COUNT(*) FROM AST_AOI_STAGE").fetchone()[0] == 1
+
+    query = sqlite_query(staged_query(OVERLAY)).format(cols='b.NAME', geom_col='SHAPE', tab='PARKS', def_query='')
+    bvars = stage.bind_vars(3005)
+    bvars['radius'] = 250
+    rows = connection.execute(query, bvars).fetchall()
+
+    assert [(name, result) for name, result, _ in rows] == [
+        ('p0', 'INTERSECT'), ('p1', 'INTERSECT'), ('p2', 'Within 250 m'), ('p3', 'Within 250 m')]
+
+
+def test_other_srid_is_not_staged():
+    connection = make_connection()
+    stage = SqliteAoiStage(shapely.to_wkb(box(0, 0, 1, 1)), 3005)
+    stage.ensure_table(connection)
+    assert not stage.stage(connection, 4326)
+
+
+def test_each_session_is_checked_once():
+    aoi = SqliteAoiStage(shapely.to_wkb(box(-10, -10, 110, 10)), 3005)
+    other = SqliteAoiStage(shapely.to_wkb(box(500, -10, 600, 10)), 3005)
+
+    connection = make_connection()
+    aoi.ensure_table(connection)
+    assert aoi.stage(connection, 3005)
+
+    # the session is known: no more round trips for the next datasets
+    statements = []
+    connection.set_trace_callback(statements.append)
+    assert aoi.stage(connection, 3005)
+    assert statements == []
+    connection.close()
+
+    # a new session (whatever its Python id) is probed, and staged
+    connection = make_connection()
+    aoi.ensure_table(connection)
+    other.ensure_table(connection)
+    assert other.stage(connection, 3005)
+    assert not aoi.is_staged(connection)
+    assert aoi.stage(connection, 3005)
+    assert connection.execute("SELECT AOI_KEY FROM AST_AOI_STAGE").fetchall() == [(aoi.key,)]
+
+
+def test_aoi_is_staged_in_bc_albers():
+    connection = make_connection()
+    stage = SqliteAoiStage(shapely.to_wkb(box(-123.3, 49.4, -123.2, 49.5)), 4326)
+    stage.ensure_table(connection)
+    assert stage.stage(connection, 3005)
+
+    srid, shape = connection.execute("SELECT SRID, SHAPE FROM AST_AOI_STAGE").fetchone()
+    assert srid == 3005
+    assert shapely.from_wkb(shape).bounds[0] > 1000000
+
+
+def test_staged_distance_query_uses_the_staged_aoi():
+    distance = ("SELECT {cols}, SDO_GEOM.SDO_DISTANCE(b.{geom_col}, "
+                "SDO_CS.TRANSFORM(SDO_GEOMETRY(:wkb_aoi, :srid), :srid_t), 0.5) DISTANCE FROM {tab} b "
+                "WHERE SDO_WITHIN_DISTANCE (b.{geom_col}, SDO_GEOMETRY(:wkb_aoi, :srid), 'distance = ' || :radius) = 'TRUE'")
+    sql = staged_query(distance)
+    assert ':wkb_aoi' not in sql and ':srid)' not in sql
+    assert 'SDO_GEOM.SDO_DISTANCE(b.{geom_col}, a.SHAPE, 0.5)' in sql
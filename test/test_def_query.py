@@ -0,0 +1,64 @@
+from pathlib import Path
+import sys
+import pytest
+
+# Use main scripts dir for the project path
+current_script_path = Path(__file__).resolve().parents[1]
+sys.path.append(str(current_script_path))
+
+from modules.def_query import parse_def_query, DefinitionQueryError
+from modules.dataset_catalogue import compile_def_query
+
+
+def test_columns_are_aliased_and_literals_bound():
+    sql, binds = parse_def_query("\"TENURE_STATUS\" = 'ACTIVE' AND AREA_HA > 10.5")
+    assert sql == "b.\"TENURE_STATUS\" = :dq0 AND b.AREA_HA > :dq1"
+    assert binds == {'dq0': 'ACTIVE', 'dq1': 10.5}
+
+
+def test_functions_in_lists_and_quoted_strings():
+    sql, binds = parse_def_query("UPPER(NAME) IN ('O''BRIEN', 'AND OR (x)') OR (CODE NOT LIKE 'A%' AND X IS NOT NULL)")
+    assert sql == "UPPER(b.NAME) IN (:dq0, :dq1) OR (b.CODE NOT LIKE :dq2 AND b.X IS NOT NULL)"
+    assert binds == {'dq0': "O'BRIEN", 'dq1': 'AND OR (x)', 'dq2': 'A%'}
+
+
+def test_quoted_identifiers_stay_quoted():
+    sql, binds = parse_def_query("\"Tenure Status\" = 'ACTIVE' AND \"AND\" IS NULL")
+    assert sql == "b.\"Tenure Status\" = :dq0 AND b.\"AND\" IS NULL"
+
+
+def test_char_columns_are_compared_trimmed():
+    # string literals are bound as VARCHAR2 (non-padded comparison): CHAR columns are trimmed
+    sql, binds = parse_def_query("RTRIM(CODE_CHR) = 'X'")
+    assert sql == "RTRIM(b.CODE_CHR) = :dq0"
+    assert binds == {'dq0': 'X'}
+
+
+def test_same_shape_gives_same_sql():
+    sql_1, binds_1 = compile_def_query("FEATURE_CODE = 'FA12345'")
+    sql_2, binds_2 = compile_def_query("FEATURE_CODE = 'GB99999'")
+    assert sql_1 == sql_2 == "AND (b.FEATURE_CODE = :dq0)"
+    assert binds_1 != binds_2
+
+
+def test_value_parentheses_and_between():
+    sql, binds = parse_def_query("(AREA + 1) * 2 BETWEEN 5 AND 10 AND ((A = 1))")
+    assert sql == "(b.AREA + :dq0) * :dq1 BETWEEN :dq2 AND :dq3 AND ((b.A = :dq4))"
+
+
+def test_empty_query():
+    assert compile_def_query(None) == (" ", {})
+
+
+@pytest.mark.parametrize('query', [
+    "A = ",
+    "A = 'unterminated",
+    "(A = 1",
+    "A = 1)",
+    "A 1",
+    "DROP_TABLE(X) = 1",
+    "A = 1; DELETE FROM T",
+])
+def test_malformed_queries_are_rejected(query):
+    with pytest.raises(DefinitionQueryError):
+        parse_def_query(query)
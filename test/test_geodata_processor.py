@@ -0,0 +1,34 @@
+from pathlib import Path
+import sys
+
+# Use main scripts dir for the project path
+current_script_path = Path(__file__).resolve().parents[1]
+sys.path.append(str(current_script_path))
+
+from modules.overlap_tool import GeoDataProcessor
+
+
+class InfoCache:
+    """Datasource descriptions as recorded by open_datasource_info"""
+    infos = {
+        'WHSE_FOREST_VEGETATION.VEG_COMP_LYR_R1_POLY': {'driver': 'unknown', 'srid': None},
+        'parks.shp': {'driver': 'ESRI Shapefile', 'srid': 4326},
+        'no_srs.shp': {'driver': 'ESRI Shapefile', 'srid': None},
+        'broken.gpkg': {'driver': 'unknown', 'srid': None, 'error': 'not a database'},
+    }
+
+    def get(self, datasource):
+        return self.infos[datasource]
+
+
+def test_extract_srid():
+    processor = GeoDataProcessor([], info_cache=InfoCache())
+
+    # tables OGR cannot open have no SRID
+    assert processor.extract_srid('WHSE_FOREST_VEGETATION.VEG_COMP_LYR_R1_POLY') is None
+    assert processor.extract_srid(None) is None
+
+    assert processor.extract_srid('parks.shp') == 4326
+    # opened without a spatial reference, or failed: BC Albers
+    assert processor.extract_srid('no_srs.shp') == 3005
+    assert processor.extract_srid('broken.gpkg') == 3005
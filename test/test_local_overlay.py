@@ -0,0 +1,25 @@
+from pathlib import Path
+import sys
+import geopandas as gpd
+from shapely.geometry import box, Point
+
+# Use main scripts dir for the project path
+current_script_path = Path(__file__).resolve().parents[1]
+sys.path.append(str(current_script_path))
+
+from modules.local_overlay import LocalOverlayEngine
+
+
+def test_radius_is_in_metres_for_a_geographic_layer(tmp_path):
+    aoi = box(1200000, 480000, 1201000, 481000)   # BC Albers
+    points = gpd.GeoDataFrame({'NAME': ['inside', 'near', 'far']},
+                              geometry=[Point(1200500, 480500), Point(1201300, 480500), Point(1201800, 480500)],
+                              crs=3005).to_crs(4326)
+    layer = str(tmp_path / 'points.gpkg')
+    points.to_file(layer)
+
+    engine = LocalOverlayEngine(aoi, 'EPSG:3005')
+    gdf = engine.overlay(layer, radius=500, columns=['NAME'])
+
+    assert gdf.crs.to_epsg() == 3005
+    assert list(zip(gdf['NAME'], gdf['RESULT'])) == [('inside', 'INTERSECT'), ('near', 'Within 500 m')]
@@ -0,0 +1,58 @@
+from pathlib import Path
+import sys
+import oracledb
+import pyarrow as pa
+
+# Use main scripts dir for the project path
+current_script_path = Path(__file__).resolve().parents[1]
+sys.path.append(str(current_script_path))
+
+from modules.query_fetch import read_arrow
+
+
+class FakeCursor:
+    """Cursor returning fixed rows, with the (name, type, ..., precision, scale) description of oracledb"""
+    def __init__(self, description, rows):
+        self.description = description
+        self.rows = rows
+
+    def execute(self, query, bvars):
+        pass
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, description, rows):
+        self.description = description
+        self.rows = rows
+
+    def cursor(self):
+        return FakeCursor(self.description, list(self.rows))
+
+
+DESCRIPTION = [('NAME', oracledb.DB_TYPE_VARCHAR, 50, 50, None, None, True),
+               ('DISTANCE', oracledb.DB_TYPE_NUMBER, 127, 22, 0, -127, True),
+               ('FEATURE_ID', oracledb.DB_TYPE_NUMBER, 10, 22, 10, 0, True)]
+
+
+def test_integral_and_fractional_batches_share_one_schema():
+    # first batch: intersecting rows (distance exactly 0, fetched as int), second: fractional distances
+    rows = [('a', 0, 1), ('b', 0, 2), ('c', 12.5, 3), ('d', None, None)]
+    table = read_arrow(FakeConnection(DESCRIPTION, rows), 'SELECT', arraysize=2)
+
+    assert table.schema.field('DISTANCE').type == pa.float64()
+    assert table.schema.field('FEATURE_ID').type == pa.int64()
+    assert table.column('DISTANCE').to_pylist() == [0.0, 0.0, 12.5, None]
+
+
+def test_empty_result_keeps_the_schema():
+    table = read_arrow(FakeConnection(DESCRIPTION, []), 'SELECT')
+
+    assert table.num_rows == 0
+    assert table.schema.field('DISTANCE').type == pa.float64()